@@ -0,0 +1,154 @@
+# Array-backed index of precomputed recommendations, for serving
+#
+# A batch is a folder of .npy arrays under the index root, opened memory
+# mapped so the operating system shares and pages it in; lookups are binary
+# searches over the sorted customer and product keys. The file CURRENT names
+# the batch being served: a new batch is published by writing its folder and
+# then replacing CURRENT, and readers following CURRENT swap to it on their
+# next lookup.
+import json
+import os
+import pathlib
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from recommender import top_k
+
+APP_PATH = pathlib.Path(__file__).parent.resolve()
+INDEX_DIR = pathlib.Path(os.environ.get(
+    'RECOMMENDER_INDEX', str(APP_PATH / 'index')))
+
+# Older batches kept next to the current one
+KEEP = 2
+
+ARRAYS = ['customers', 'customer_items', 'customer_counts',
+          'products', 'product_items', 'product_counts',
+          'item_products', 'item_descriptions']
+
+
+# Rows of item codes and counts, best first, padded with -1 and 0
+def padded(rows, item, cnt, n_rows, k):
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else rows
+    col = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+    items = np.full((n_rows, k), -1, dtype=np.int32)
+    counts = np.zeros((n_rows, k), dtype=np.int32)
+    items[rows, col] = item
+    counts[rows, col] = cnt
+    return items, counts
+
+
+# The arrays of a batch from a Recommender: the top k of every customer and
+# the k items most often bought after each product
+def build(rec):
+    k = rec.k
+    cust, rank, item, cnt = rec.stored()
+    by_cust = np.argsort(rec.customers.to_numpy(), kind='stable')
+    position = np.empty_like(by_cust)
+    position[by_cust] = np.arange(len(by_cust))
+    order = np.lexsort((rank, position[cust]))
+    customer_items, customer_counts = padded(position[cust][order], item[order], cnt[order],
+                                             len(rec.customers), k)
+
+    neighbours = rec.by_product
+    prod = np.repeat(np.arange(neighbours.shape[0]), np.diff(neighbours.indptr))
+    prod, _, item, cnt = top_k(prod, neighbours.indices, neighbours.data, k)
+    products = rec.products.to_numpy(dtype=str)
+    by_prod = np.argsort(products, kind='stable')
+    position = np.empty_like(by_prod)
+    position[by_prod] = np.arange(len(by_prod))
+    product_items, product_counts = padded(position[prod], item, cnt, len(products), k)
+
+    return {'customers': rec.customers.to_numpy()[by_cust].astype(np.int64),
+            'customer_items': customer_items,
+            'customer_counts': customer_counts,
+            'products': products[by_prod],
+            'product_items': product_items,
+            'product_counts': product_counts,
+            'item_products': rec.items.get_level_values('product_id').to_numpy(dtype=str),
+            'item_descriptions': rec.items.get_level_values('description').to_numpy(dtype=str)}
+
+
+# Write a new batch and make it the current one, removing old batches
+def publish(rec, root=INDEX_DIR, keep=KEEP):
+    root = pathlib.Path(root)
+    version = '{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), uuid.uuid4().hex[:6])
+    tmp = root / ('.' + version)
+    tmp.mkdir(parents=True)
+    for name, array in build(rec).items():
+        np.save(str(tmp / (name + '.npy')), array)
+    (tmp / 'manifest.json').write_text(json.dumps({
+        'version': version, 'k': rec.k, 'watermark': rec.watermark,
+        'customers': len(rec.customers), 'products': len(rec.products)}, indent=2))
+    os.rename(str(tmp), str(root / version))
+
+    current = root / 'CURRENT.tmp'
+    current.write_text(version)
+    os.replace(str(current), str(root / 'CURRENT'))
+
+    batches = sorted(p for p in root.iterdir() if p.is_dir() and not p.name.startswith('.'))
+    for old in batches[:-(keep + 1)]:
+        shutil.rmtree(str(old), ignore_errors=True)
+    return version
+
+
+class Index:
+    # One batch, memory mapped
+
+    def __init__(self, path):
+        path = pathlib.Path(path)
+        self.version = path.name
+        for name in ARRAYS:
+            setattr(self, name, np.load(str(path / (name + '.npy')), mmap_mode='r'))
+
+    def entries(self, items, counts):
+        return [{'product_id': str(self.item_products[i]),
+                 'description': str(self.item_descriptions[i]),
+                 'cnt': int(c)} for i, c in zip(items.tolist(), counts.tolist()) if i >= 0]
+
+    # product_recommendation of a customer, None if the customer is unknown
+    def recommend(self, customer_id):
+        i = int(np.searchsorted(self.customers, customer_id))
+        if i == len(self.customers) or self.customers[i] != customer_id:
+            return None
+        return self.entries(self.customer_items[i], self.customer_counts[i])
+
+    # Items most often bought after the product, None if it is unknown
+    def similar(self, product_id):
+        i = int(np.searchsorted(self.products, product_id))
+        if i == len(self.products) or self.products[i] != product_id:
+            return None
+        return self.entries(self.product_items[i], self.product_counts[i])
+
+
+class Live:
+    # The current batch of an index root. CURRENT is checked at most every
+    # interval seconds, and a new batch replaces the old one in one step, so
+    # requests in flight finish on the batch they started with.
+
+    def __init__(self, root=INDEX_DIR, interval=1.0):
+        self.root = pathlib.Path(root)
+        self.interval = interval
+        self.index = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if now - self.checked >= self.interval or self.index is None:
+            with self.lock:
+                if now - self.checked >= self.interval or self.index is None:
+                    self.checked = now
+                    self.reload()
+        return self.index
+
+    def reload(self):
+        try:
+            version = (self.root / 'CURRENT').read_text().strip()
+        except FileNotFoundError:
+            return
+        if self.index is None or self.index.version != version:
+            self.index = Index(self.root / version)
@@ -0,0 +1,535 @@
+#!/bin/env python3
+
+# Co-occurrence product recommendations without a Hadoop cluster
+#
+# Builds the tables of the hive script in memory from Ecommerce_data.csv:
+#   customer_purchased_final          purchases(), one row per customer and item
+#   recently_purchased_product_final  the latest TOP_K items of each customer
+#   cooccurrence_final                Recommender.counts, a sparse item x item matrix
+#   product_recommendation            Recommender.recommend()
+#
+#   python recommender.py recommend Ecommerce_data.csv -o recommendations.jsonl
+#   python recommender.py validate Ecommerce_data.csv --customers 500
+#
+# Daily refreshes keep the counts in a state file and only process the rows
+# bought after the last refresh, writing the recommendations that changed:
+#   python recommender.py update state.pkl Ecommerce_data.csv -o changed.jsonl
+#
+# Add --publish to either to write a new batch of the index served by serve.py.
+#
+# As in Hive, an item is a product_id and description pair.
+import argparse
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+COLUMNS = ['invoice_no', 'product_id', 'description', 'quantity',
+           'purchased_at', 'unit_price', 'customer_id', 'country']
+
+# UNIX_TIMESTAMP(purchased_at, 'dd/MM/yyyy HH:mm') in the hive script
+DATE_FORMAT = '%d/%m/%Y %H:%M'
+
+TOP_K = 5
+
+# having cnt >= 2 on cooccurrence_final
+MIN_COUNT = 2
+
+# Item pairs expanded at once while counting co-occurrences
+MAX_PAIRS = 10000000
+
+# Cells of the padded customer x candidate block used for the top-k
+BLOCK_CELLS = 10000000
+
+# Columns telling apart the raw rows bought in the same minute
+ROW_KEY = ['invoice_no', 'product_id', 'customer_id']
+
+
+def read_csv(path, encoding='latin-1'):
+    return pd.read_csv(path, header=0, names=COLUMNS, encoding=encoding,
+                       dtype={'invoice_no': str, 'product_id': str,
+                              'description': str, 'country': str})
+
+
+# Seconds since the epoch, NaN where the date does not parse
+def timestamps(dates, date_format=DATE_FORMAT):
+    when = pd.to_datetime(dates, format=date_format, errors='coerce')
+    return (when - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+
+
+# One string per raw row identifying the purchase, for counting the rows
+# already added
+def row_keys(raw):
+    keys = raw[ROW_KEY[0]].astype(str)
+    for col in ROW_KEY[1:]:
+        keys = keys + '\x1f' + raw[col].astype(str)
+    return keys
+
+
+# customer_purchased_final: the last purchase time and number of purchases
+# of each item by each customer
+def purchases(raw, date_format=DATE_FORMAT):
+    df = raw.assign(customer_id=pd.to_numeric(raw['customer_id'], errors='coerce'))
+    df = df[df['customer_id'].notna() & df['description'].notna()]
+    df = df.assign(purchased_at=timestamps(df['purchased_at'], date_format))
+
+    bought = df.groupby(['customer_id', 'product_id', 'description'], sort=False).agg(
+        purchased_at=('purchased_at', 'max'), purchase_count=('purchased_at', 'size'))
+    bought = bought[bought['purchased_at'].notna()].reset_index()
+    return bought.astype({'customer_id': np.int64, 'purchased_at': np.int64,
+                          'purchase_count': np.int64})
+
+
+# Both row positions (i, j) of every pair of purchases by the same customer
+# with j bought no earlier than i. rows must be sorted by customer, then by
+# time; the pairs come in chunks of whole customers.
+def ordered_pairs(cust, t, max_pairs=MAX_PAIRS):
+    n = len(cust)
+    if not n:
+        return
+    pos = np.arange(n)
+    new_cust = np.r_[True, cust[1:] != cust[:-1]]
+    new_time = new_cust | np.r_[True, t[1:] != t[:-1]]
+
+    # Row i pairs with every row of its customer from the first one bought at
+    # the same time up to the customer's last row
+    lo = np.maximum.accumulate(np.where(new_time, pos, 0))
+    starts = np.flatnonzero(new_cust)
+    ends = np.r_[starts[1:], n]
+    counts = np.repeat(ends, ends - starts) - lo
+
+    # Customers whose pairs start within max_pairs of the chunk's first one
+    before = (np.cumsum(counts) - counts)[starts]
+    first = 0
+    while first < len(starts):
+        last = max(np.searchsorted(before, before[first] + max_pairs), first + 1)
+        rows = slice(starts[first], ends[last - 1])
+        c = counts[rows]
+        offsets = np.repeat(np.cumsum(c) - c, c)
+        i = np.repeat(pos[rows], c)
+        j = np.repeat(lo[rows], c) + np.arange(c.sum()) - offsets
+        yield i, j
+        first = last
+
+
+# Largest value of each column over the rows of each group, as a sparse
+# group x column matrix
+def max_by_rows(matrix, groups, n_groups):
+    coo = matrix.tocoo()
+    if not coo.nnz:
+        return sparse.csr_matrix((n_groups, matrix.shape[1]), dtype=matrix.dtype)
+    row = groups[coo.row]
+    order = np.lexsort((coo.data, coo.col, row))
+    row, col, data = row[order], coo.col[order], coo.data[order]
+    last = np.r_[(row[1:] != row[:-1]) | (col[1:] != col[:-1]), True]
+    return sparse.csr_matrix((data[last], (row[last], col[last])),
+                             shape=(n_groups, matrix.shape[1]))
+
+
+# The k largest counts of each customer, best first. The candidates must be
+# sorted by customer; each block of customers is padded to a dense array so
+# the top k of every row is found with one argpartition.
+def top_k(cust, item, cnt, k):
+    starts = np.flatnonzero(np.r_[True, cust[1:] != cust[:-1]]) if len(cust) else cust
+    sizes = np.diff(np.r_[starts, len(cust)])
+    parts = []
+    width = int(sizes.max()) if len(sizes) else 0
+    block = max(1, BLOCK_CELLS // max(width, 1))
+    for first in range(0, len(starts), block):
+        group = slice(first, first + block)
+        n = len(starts[group])
+        lo = starts[first]
+        hi = starts[first + n] if first + n < len(starts) else len(cust)
+        row = np.repeat(np.arange(n), sizes[group])
+        col = np.arange(lo, hi) - np.repeat(starts[group], sizes[group])
+        scores = np.zeros((n, width), dtype=cnt.dtype)
+        items = np.zeros((n, width), dtype=item.dtype)
+        scores[row, col] = cnt[lo:hi]
+        items[row, col] = item[lo:hi]
+
+        if width > k:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(scores, top, axis=1)
+            items = np.take_along_axis(items, top, axis=1)
+        order = np.lexsort((items, -scores))
+        scores = np.take_along_axis(scores, order, axis=1)
+        items = np.take_along_axis(items, order, axis=1)
+        keep = scores > 0
+        ranks = np.broadcast_to(np.arange(1, scores.shape[1] + 1), scores.shape)
+        codes = np.broadcast_to(cust[starts[group]][:, None], scores.shape)
+        parts.append((codes[keep], ranks[keep], items[keep], scores[keep]))
+    if not parts:
+        return cust, cust, item, cnt
+    return tuple(np.concatenate(p) for p in zip(*parts))
+
+
+class Recommender:
+    # Item-item co-occurrence counts and the ranked recommendations of a
+    # customer_purchased table. Customers, items and products are numbered in
+    # order of appearance, and the purchases are kept with the rows of each
+    # customer together, ordered by time.
+    #
+    # New purchases are added with add() or update(): only the customers who
+    # bought something are recounted, and only the customers whose recent
+    # products' counts changed are ranked again.
+
+    def __init__(self, bought=None, k=TOP_K, min_count=MIN_COUNT):
+        self.k = k
+        self.min_count = min_count
+        self.watermark = None
+        # Number of raw rows added so far for each row key bought at the
+        # watermark
+        self.seen = pd.Series([], dtype=np.int64)
+        self.seen_at = None
+        self.customers = pd.Index([], dtype=np.int64)
+        self.items = pd.MultiIndex.from_arrays([[], []], names=['product_id', 'description'])
+        self.products = pd.Index([], dtype=object)
+        self.item_product = np.array([], dtype=np.int64)
+        self.cust = self.item = self.time = self.count = np.array([], dtype=np.int64)
+        # Order in which each customer and item pair was first added, and
+        # the number of rows added so far
+        self.order = np.array([], dtype=np.int64)
+        self.added = 0
+        self.counts = sparse.csr_matrix((0, 0), dtype=np.int64)
+        self.by_product = sparse.csr_matrix((0, 0), dtype=np.int64)
+        empty = np.array([], dtype=np.int64)
+        self.top = (empty, empty, empty, empty)
+        if bought is not None:
+            self.add(bought)
+
+    # Add the raw purchase rows not added before, as read by read_csv().
+    # Purchase times only have minutes, so a file that has grown since the
+    # last update can hold new rows bought in the watermark minute: those are
+    # told apart from the rows already added by counting the rows of each
+    # invoice, product and customer bought in that minute. Rows without a
+    # purchase time cannot be placed after the watermark and are left out.
+    # Returns the codes of the customers whose recommendations were ranked
+    # again.
+    def update(self, raw, date_format=DATE_FORMAT):
+        when = timestamps(raw['purchased_at'], date_format)
+        if self.watermark is not None:
+            keep = (when > self.watermark).to_numpy(copy=True)
+            at = (when == self.watermark).to_numpy()
+            if at.any():
+                keys = row_keys(raw[at])
+                seen = keys.map(self.seen).fillna(0) if self.seen_at == self.watermark else 0
+                keep[at] = (keys.groupby(keys, sort=False).cumcount() >= seen).to_numpy()
+            raw, when = raw[keep], when[keep]
+        affected = self.add(purchases(raw, date_format))
+
+        # Remember the rows added in the watermark minute for the next update
+        counts = row_keys(raw[(when == self.watermark).to_numpy()]).value_counts()
+        if self.seen_at == self.watermark:
+            counts = self.seen.add(counts, fill_value=0).astype(np.int64)
+        self.seen, self.seen_at = counts, self.watermark
+        return affected
+
+    # Add rows of a customer_purchased table holding only purchases made
+    # after the ones already added
+    def add(self, bought):
+        if not len(bought):
+            return np.array([], dtype=np.int64)
+        self.extend(bought)
+        n_items = len(self.items)
+        cust = self.customers.get_indexer(bought['customer_id'])
+        item = self.items.get_indexer(pd.MultiIndex.from_frame(bought[['product_id', 'description']]))
+
+        # Merge the customers' previous rows with the new ones: the purchase
+        # time is the latest and the purchase counts add up. Rows bought at
+        # the same time keep the order they were first added in, as when all
+        # purchases are added at once.
+        old = np.isin(self.cust, np.unique(cust))
+        key, inverse = np.unique(np.r_[self.cust[old] * n_items + self.item[old],
+                                       cust * n_items + item], return_inverse=True)
+        inverse = inverse.ravel()
+        time = np.full(len(key), np.iinfo(np.int64).min)
+        count = np.zeros(len(key), dtype=np.int64)
+        first = np.full(len(key), np.iinfo(np.int64).max)
+        np.maximum.at(time, inverse, np.r_[self.time[old], bought['purchased_at'].to_numpy()])
+        np.add.at(count, inverse, np.r_[self.count[old], bought['purchase_count'].to_numpy()])
+        np.minimum.at(first, inverse, np.r_[self.order[old], self.added + np.arange(len(bought))])
+        self.added += len(bought)
+        order = np.lexsort((first, time, key // n_items))
+        key, time, count, first = key[order], time[order], count[order], first[order]
+
+        # Their pairs are counted again, replacing what they added before
+        delta = (self.cooccurrence(key // n_items, key % n_items, time)
+                 - self.cooccurrence(self.cust[old], self.item[old], self.time[old]))
+        self.counts = (self.counts + delta).tocsr()
+        self.counts.eliminate_zeros()
+
+        self.cust = np.r_[self.cust[~old], key // n_items]
+        self.item = np.r_[self.item[~old], key % n_items]
+        self.time = np.r_[self.time[~old], time]
+        self.count = np.r_[self.count[~old], count]
+        self.order = np.r_[self.order[~old], first]
+        latest = int(bought['purchased_at'].max())
+        self.watermark = latest if self.watermark is None else max(self.watermark, latest)
+
+        # Rank again every buyer and every customer with a recent product
+        # whose counts changed
+        changed = self.refresh_products(np.unique(self.item_product[delta.tocoo().row]))
+        rows = self.recent()
+        rows = rows[np.isin(self.item_product[self.item[rows]], changed)]
+        affected = np.union1d(np.unique(cust), self.cust[rows])
+        keep = ~np.isin(self.top[0], affected)
+        self.top = tuple(np.r_[old_part[keep], new_part]
+                         for old_part, new_part in zip(self.top, self.ranked(affected)))
+        return affected
+
+    # Number the customers, items and products not seen before
+    def extend(self, bought):
+        customers = pd.Index(bought['customer_id'].unique())
+        self.customers = self.customers.append(customers[~customers.isin(self.customers)])
+        items = pd.MultiIndex.from_frame(bought[['product_id', 'description']].drop_duplicates())
+        items = items[~items.isin(self.items)]
+        self.items = self.items.append(items)
+        products = pd.Index(items.get_level_values('product_id').unique())
+        self.products = self.products.append(products[~products.isin(self.products)])
+        self.item_product = np.r_[self.item_product,
+                                  self.products.get_indexer(items.get_level_values('product_id'))]
+        n, p = len(self.items), len(self.products)
+        self.counts.resize((n, n))
+        self.by_product.resize((p, n))
+
+    # cooccurrence_final before the having clause: for each pair of items of
+    # different products, the customers who bought the second no earlier
+    # than the first
+    def cooccurrence(self, cust, item, t):
+        n = len(self.items)
+        counts = sparse.csr_matrix((n, n), dtype=np.int64)
+        for i, j in ordered_pairs(cust, t):
+            a, b = item[i], item[j]
+            keep = self.item_product[a] != self.item_product[b]
+            counts = counts + sparse.csr_matrix(
+                (np.ones(keep.sum(), dtype=np.int64), (a[keep], b[keep])), shape=(n, n))
+        return counts
+
+    # Recompute the rows of by_product, the largest frequent count of each
+    # product's items with every other item, for the given products. Returns
+    # the products whose row changed.
+    def refresh_products(self, products):
+        items = np.flatnonzero(np.isin(self.item_product, products))
+        counts = self.counts[items]
+        counts.data[counts.data < self.min_count] = 0
+        counts.eliminate_zeros()
+        rows = max_by_rows(counts, self.item_product[items], len(self.products))
+        keep = sparse.diags((~np.isin(np.arange(len(self.products)), products)).astype(np.int64),
+                            dtype=np.int64)
+        before = self.by_product
+        self.by_product = (keep @ before + rows).tocsr()
+        return np.unique((self.by_product != before).tocoo().row)
+
+    # Row positions of the latest k purchases of each customer
+    def recent(self):
+        n = len(self.cust)
+        ends = np.r_[np.flatnonzero(self.cust[1:] != self.cust[:-1]) + 1, n]
+        remaining = np.repeat(ends, np.diff(np.r_[0, ends])) - np.arange(n)
+        return np.flatnonzero(remaining <= self.k)
+
+    # Rank the recommendations of the given customer codes (all by default)
+    # as customer, rank, item and count arrays
+    def ranked(self, customers=None):
+        n_customers, n_products, n_items = len(self.customers), len(self.products), len(self.items)
+        by_product = self.by_product
+
+        # Each customer has at most k recent products. Selecting the s-th of
+        # them with a one-hot customer x product matrix copies its row of
+        # counts, and the element-wise maximum over s gives max(t2.cnt).
+        rows = self.recent()
+        if customers is not None:
+            rows = rows[np.isin(self.cust[rows], customers)]
+        cust = self.cust[rows]
+        starts = np.flatnonzero(np.r_[True, cust[1:] != cust[:-1]]) if len(cust) else cust
+        slot = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+        scores = sparse.csr_matrix((n_customers, n_items), dtype=by_product.dtype)
+        for s in range(self.k):
+            pick = slot == s
+            select = sparse.csr_matrix(
+                (np.ones(pick.sum(), dtype=by_product.dtype),
+                 (cust[pick], self.item_product[self.item[rows[pick]]])),
+                shape=(n_customers, n_products))
+            scores = scores.maximum(select @ by_product)
+
+        # Products the customer bought only once are never recommended
+        once = (self.count <= 1) & np.isin(self.cust, cust)
+        bought_once = sparse.csr_matrix(
+            (np.ones(once.sum(), dtype=by_product.dtype),
+             (self.cust[once], self.item_product[self.item[once]])),
+            shape=(n_customers, n_products))
+        of_product = sparse.csr_matrix(
+            (np.ones(n_items, dtype=by_product.dtype), (self.item_product, np.arange(n_items))),
+            shape=(n_products, n_items))
+        excluded = (bought_once @ of_product).sign()
+        scores = (scores - scores.multiply(excluded)).tocsr()
+        scores.eliminate_zeros()
+        scores.sort_indices()
+
+        cust = np.repeat(np.arange(n_customers), np.diff(scores.indptr))
+        return top_k(cust, scores.indices, scores.data, self.k)
+
+    # The ranked recommendations of the given customer codes (all by default)
+    def stored(self, customers=None):
+        if customers is None:
+            return self.top
+        keep = np.isin(self.top[0], customers)
+        return tuple(part[keep] for part in self.top)
+
+    # The ranked recommendations as a table like the topk step of the hive script
+    def topk(self, customers=None):
+        cust, rank, item, cnt = self.stored(customers)
+        return pd.DataFrame({
+            'customer_id': self.customers[cust],
+            'rank': rank,
+            'product_id': self.items.get_level_values('product_id')[item],
+            'description': self.items.get_level_values('description')[item],
+            'cnt': cnt})
+
+    # product_recommendation: the recommended products and their descriptions
+    # of each customer, best first. Customers given by code without any
+    # recommendation are listed with empty lists.
+    def recommend(self, customers=None):
+        cust, rank, item, cnt = self.stored(customers)
+        starts = np.flatnonzero(rank == 1)
+        products = self.items.get_level_values('product_id').to_numpy(dtype=object)[item]
+        descriptions = self.items.get_level_values('description').to_numpy(dtype=object)[item]
+        split = starts[1:] if len(starts) else []
+        result = pd.DataFrame({
+            'customer_id': self.customers[cust[starts]],
+            'rec_product': [p.tolist() for p in np.split(products, split)][:len(starts)],
+            'description': [d.tolist() for d in np.split(descriptions, split)][:len(starts)]})
+        if customers is not None:
+            missing = self.customers[np.setdiff1d(customers, cust)]
+            result = pd.concat([result, pd.DataFrame({
+                'customer_id': missing, 'rec_product': [[] for _ in missing],
+                'description': [[] for _ in missing]})], ignore_index=True)
+        return result
+
+    def save(self, path):
+        with open(str(path), 'wb') as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path):
+        with open(str(path), 'rb') as f:
+            return pickle.load(f)
+
+
+# The topk candidates computed literally as the hive script's joins, for
+# checking Recommender on a sample of customers
+def reference(bought, k=TOP_K, min_count=MIN_COUNT):
+    ordered = bought.sort_values(['customer_id', 'purchased_at'], kind='stable')
+    recent = ordered.groupby('customer_id').tail(k)
+
+    u = bought[['customer_id', 'product_id', 'description', 'purchased_at']]
+    pairs = u.merge(u, on='customer_id', suffixes=('', '_2'))
+    pairs = pairs[(pairs['product_id'] != pairs['product_id_2'])
+                  & (pairs['purchased_at_2'] >= pairs['purchased_at'])]
+    cooc = pairs.groupby(['product_id', 'description', 'product_id_2', 'description_2']).size()
+    cooc = cooc[cooc >= min_count].rename('cnt').reset_index()
+
+    joined = recent[['customer_id', 'product_id']].merge(
+        cooc.drop(columns='description'), on='product_id')
+    once = bought.loc[bought['purchase_count'] <= 1, ['customer_id', 'product_id']]
+    once = once.rename(columns={'product_id': 'product_id_2'}).assign(excluded=True)
+    joined = joined.merge(once, on=['customer_id', 'product_id_2'], how='left')
+    joined = joined[joined['excluded'].isna()]
+    return joined.groupby(['customer_id', 'product_id_2', 'description_2'])['cnt'].max().reset_index()
+
+
+# Customers whose recommendations differ from the reference. Ties in count
+# may be broken differently, so the counts of the top k are compared and
+# every recommended item has to be a candidate with that count.
+def mismatches(topk, candidates, k=TOP_K):
+    expected = candidates.sort_values('cnt', ascending=False).groupby('customer_id').head(k)
+    expected = expected.groupby('customer_id')['cnt'].agg(sorted)
+    got = topk.groupby('customer_id')['cnt'].agg(sorted)
+    bad = set(expected.index.symmetric_difference(got.index))
+    both = expected.index.intersection(got.index)
+    bad.update(c for c in both if expected[c] != got[c])
+
+    known = topk.merge(candidates.rename(columns={'product_id_2': 'product_id',
+                                                  'description_2': 'description',
+                                                  'cnt': 'expected'}),
+                       on=['customer_id', 'product_id', 'description'], how='left')
+    bad.update(known.loc[known['cnt'] != known['expected'], 'customer_id'])
+    return sorted(bad)
+
+
+def publish(rec, root):
+    if root is not None:
+        import index
+        version = index.publish(rec, root or index.INDEX_DIR)
+        print('Published index batch', version, file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Co-occurrence product recommendations.')
+    commands = parser.add_subparsers(dest='command')
+    recommend = commands.add_parser('recommend', help='write the recommendations of every customer')
+    recommend.add_argument('input', help='purchase CSV, as Ecommerce_data.csv')
+    recommend.add_argument('-o', '--output', default='-',
+                           help='output JSON lines file (default: standard output)')
+    validate = commands.add_parser('validate', help='compare with the hive script on a sample')
+    validate.add_argument('input', help='purchase CSV, as Ecommerce_data.csv')
+    validate.add_argument('--customers', type=int, default=500, help='customers in the sample')
+    validate.add_argument('--seed', type=int, default=0)
+    update = commands.add_parser('update', help='add new purchases to a state file')
+    update.add_argument('state', help='state file, created on the first run')
+    update.add_argument('input', nargs='+', help='purchase CSVs, as Ecommerce_data.csv')
+    update.add_argument('-o', '--output', default='-',
+                        help='JSON lines file for the changed recommendations '
+                             '(default: standard output)')
+    for command in (recommend, validate, update):
+        command.add_argument('--date-format', default=DATE_FORMAT)
+        command.add_argument('--encoding', default='latin-1')
+    for command in (recommend, update):
+        command.add_argument('--publish', nargs='?', const='', metavar='DIR',
+                             help='publish an index batch for serve.py (default: index)')
+    args = parser.parse_args()
+
+    if args.command is None:
+        parser.print_help()
+        return 0
+    if args.command == 'update':
+        start = time.perf_counter()
+        rec = Recommender.load(args.state) if os.path.exists(args.state) else Recommender()
+        affected = np.unique(np.concatenate(
+            [rec.update(read_csv(path, args.encoding), args.date_format) for path in args.input]))
+        result = rec.recommend(affected)
+        result.to_json(args.output if args.output != '-' else sys.stdout,
+                       orient='records', lines=True)
+        rec.save(args.state)
+        publish(rec, args.publish)
+        print('{} customers ranked again of {}, {:.1f}s'.format(
+            len(affected), len(rec.customers), time.perf_counter() - start), file=sys.stderr)
+        return 0
+
+    bought = purchases(read_csv(args.input, args.encoding), args.date_format)
+    if args.command == 'recommend':
+        rec = Recommender(bought)
+        rec.recommend().to_json(args.output if args.output != '-' else sys.stdout,
+                                orient='records', lines=True)
+        publish(rec, args.publish)
+        return 0
+
+    customers = pd.Series(bought['customer_id'].unique())
+    sample = customers.sample(min(args.customers, len(customers)), random_state=args.seed)
+    bought = bought[bought['customer_id'].isin(sample)]
+    topk = Recommender(bought).topk()
+    bad = mismatches(topk, reference(bought))
+    print('{} customers, {} recommendations, {} differ from the hive script'.format(
+        len(sample), len(topk), len(bad)))
+    for c in bad[:10]:
+        print('  customer', c)
+    return 1 if bad else 0
+
+
+if __name__ == '__main__':
+    # Run from the imported module, so pickled state refers to recommender.Recommender
+    import recommender
+    raise SystemExit(recommender.main())
@@ -0,0 +1,67 @@
+#!/bin/env python3
+
+# Recommendation lookups over HTTP, from the index published by recommender.py
+#
+#   python serve.py --port 8060
+#   gunicorn serve:server
+#
+#   GET /recommend/<customer_id>   top 5 products for a customer
+#   GET /similar/<product_id>      products most often bought after a product
+#   GET /metrics                   request latencies for Prometheus
+#
+# A batch published while the server runs is picked up within a second.
+import argparse
+import os
+import pathlib
+import sys
+
+import flask
+
+import index
+
+# The shdata package shared with the web applications lives in the repository root
+APP_PATH = str(pathlib.Path(__file__).parent.resolve())
+sys.path.append(os.path.dirname(APP_PATH))
+
+from shdata import timing  # noqa: E402
+
+server = flask.Flask(__name__)
+live = index.Live(os.environ.get('RECOMMENDER_INDEX', str(index.INDEX_DIR)))
+
+timing.instrument(server)
+
+
+def respond(batch, name, key, items):
+    if items is None:
+        return flask.jsonify({'error': 'unknown ' + name}), 404
+    return flask.jsonify({name: key, 'version': batch.version, 'items': items})
+
+
+@server.before_request
+def require_index():
+    if flask.request.path != '/metrics' and live.get() is None:
+        return flask.jsonify({'error': 'no index published yet'}), 503
+
+
+@server.route('/recommend/<int:customer_id>')
+def recommend(customer_id):
+    batch = live.get()
+    return respond(batch, 'customer_id', customer_id, batch.recommend(customer_id))
+
+
+@server.route('/similar/<product_id>')
+def similar(product_id):
+    batch = live.get()
+    return respond(batch, 'product_id', product_id, batch.similar(product_id))
+
+
+@server.route('/health')
+def health():
+    return flask.jsonify({'version': live.get().version})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve recommendation lookups.')
+    parser.add_argument('--port', type=int, default=8060)
+    args = parser.parse_args()
+    server.run(host='0.0.0.0', port=args.port, threaded=True)
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+import recommender
+
+
+# Raw rows as read by read_csv(), in time order with many rows per minute,
+# some bought twice and a few without a customer
+def raw_rows(rows=4000, seed=0):
+    rng = np.random.RandomState(seed)
+    cust = rng.randint(0, 150, rows)
+    product = (cust % 10 * 6 + rng.randint(0, 12, rows)) % 60
+    minute = np.sort(rng.randint(0, 30, rows))
+    raw = pd.DataFrame({
+        'invoice_no': (500000 + rng.randint(0, 40, rows)).astype(str),
+        'product_id': ['P%03d' % p for p in product],
+        'description': ['ITEM %d%s' % (p, ' V2' if p % 20 == 0 and v else '')
+                        for p, v in zip(product, rng.randint(0, 2, rows))],
+        'quantity': rng.randint(1, 5, rows),
+        'purchased_at': ['01/12/2010 10:%02d' % m for m in minute],
+        'unit_price': rng.randint(1, 50, rows),
+        'customer_id': (12000 + cust).astype(float),
+        'country': 'Malaysia'})
+    raw.loc[rng.rand(rows) < 0.03, 'customer_id'] = np.nan
+    twice = rng.rand(rows) < 0.1
+    return pd.concat([raw, raw[twice]]).sort_values('purchased_at', kind='stable').reset_index(drop=True)
+
+
+def ranked(topk):
+    return topk.sort_values(['customer_id', 'rank']).reset_index(drop=True)
+
+
+def test_topk_matches_reference():
+    bought = recommender.purchases(raw_rows())
+    rec = recommender.Recommender(bought)
+    topk = rec.topk()
+    assert len(topk)
+    assert recommender.mismatches(topk, recommender.reference(bought)) == []
+
+
+# A file growing between updates, cut inside minutes as well as at their end
+def test_update_matches_rebuild():
+    raw = raw_rows()
+    rec = recommender.Recommender()
+    for cut in (1000, 1003, 2500, 2501, 3100, len(raw), len(raw)):
+        rec.update(raw.iloc[:cut])
+    full = recommender.Recommender()
+    full.update(raw)
+
+    pd.testing.assert_frame_equal(ranked(rec.topk()), ranked(full.topk()))
+    expected = full.recommend().sort_values('customer_id').reset_index(drop=True)
+    got = rec.recommend().sort_values('customer_id').reset_index(drop=True)
+    pd.testing.assert_frame_equal(got, expected)
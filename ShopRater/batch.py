@@ -0,0 +1,142 @@
+#!/bin/env python3
+
+# Batch scoring of candidate listings against a category's rating model.
+#
+# Score a file from the command line, writing the estimates as CSV:
+#   python batch.py score Automotive candidates.csv -o scored.csv
+#
+# Or serve the same over HTTP, posting a CSV body and streaming back CSV:
+#   python batch.py serve --port 8502
+#   curl --data-binary @candidates.csv http://localhost:8502/score/Automotive
+#
+# Candidate files hold one listing per row with the columns in FEATURES.
+# ResponseRate is a fraction (0.9 for 90%), as in the scraped data.
+import argparse
+import io
+import sys
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+import model_store
+from loader import load_df
+
+FEATURES = ['Ratings', 'Sold', 'PriceMin', 'PriceMax',
+            'SellerRatings', 'ResponseRate', 'Followers']
+
+CHUNK_ROWS = 50000
+
+
+# Normalize the feature columns of every row at once. sklearn is imported on
+# the first prediction, which has to unpickle a model from it anyway.
+def prepare(df):
+    from sklearn import preprocessing
+
+    missing = [c for c in FEATURES if c not in df.columns]
+    if missing:
+        raise ValueError('Missing columns: ' + ', '.join(missing))
+    X = df[FEATURES].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    return preprocessing.normalize(np.nan_to_num(X))
+
+
+# Estimated rating (Stars) of each listing
+def predict_stars(model, df):
+    return (1 - model.predict(prepare(df))) * 5
+
+
+# Read a CSV or Parquet file in chunks of rows
+def read_chunks(source, name, size=CHUNK_ROWS):
+    if str(name).endswith('.parquet'):
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=size):
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(source, chunksize=size):
+            yield chunk
+
+
+# Add the estimate to each chunk as it is read
+def score_chunks(model, chunks):
+    for chunk in chunks:
+        chunk['StarsEstimate'] = predict_stars(model, chunk).round(2)
+        yield chunk
+
+
+# Write scored chunks as one CSV stream, header first
+def write_csv(chunks, out):
+    header = True
+    for chunk in chunks:
+        chunk.to_csv(out, header=header, index=False)
+        header = False
+
+
+def load_model(cat):
+    return model_store.get_model(cat, load_df(cat))['model']
+
+
+class ScoreHandler(BaseHTTPRequestHandler):
+    # Chunked responses need HTTP/1.1
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        parts = self.path.strip('/').split('/', 1)
+        if len(parts) != 2 or parts[0] != 'score':
+            self.send_error(404, 'Use POST /score/<category>')
+            return
+        cat = urllib.parse.unquote(parts[1])
+        body = io.BytesIO(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        # Parquet bodies are sent with a Content-Type mentioning parquet
+        name = 'body.parquet' if 'parquet' in self.headers.get('Content-Type', '') else 'body.csv'
+        try:
+            chunks = score_chunks(load_model(cat), read_chunks(body, name))
+            first = next(chunks, None)
+        except Exception as e:
+            self.send_error(400, str(e))
+            return
+
+        # Stream the result back chunk by chunk
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        if first is not None:
+            self.send_chunk(first, True)
+            for chunk in chunks:
+                self.send_chunk(chunk, False)
+        self.wfile.write(b'0\r\n\r\n')
+
+    def send_chunk(self, chunk, header):
+        data = chunk.to_csv(header=header, index=False).encode()
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Score candidate listings with a category rating model.')
+    commands = parser.add_subparsers(dest='command')
+    score = commands.add_parser('score', help='score a CSV or Parquet file')
+    score.add_argument('category')
+    score.add_argument('input')
+    score.add_argument('-o', '--output', default='-',
+                       help='output CSV file (default: standard output)')
+    serve = commands.add_parser('serve', help='serve POST /score/<category>')
+    serve.add_argument('--port', type=int, default=8502)
+    args = parser.parse_args()
+
+    if args.command == 'score':
+        chunks = score_chunks(load_model(args.category), read_chunks(args.input, args.input))
+        if args.output == '-':
+            write_csv(chunks, sys.stdout)
+        else:
+            with open(args.output, 'w', newline='') as out:
+                write_csv(chunks, out)
+    elif args.command == 'serve':
+        ThreadingHTTPServer(('', args.port), ScoreHandler).serve_forever()
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
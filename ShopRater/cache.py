@@ -0,0 +1,143 @@
+# In-process caches shared across Streamlit reruns
+#
+# Streamlit re-executes sh_app.py from the top on every widget change, but
+# modules imported by it stay loaded, so anything kept here survives reruns.
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+# Estimate the memory held by a cached value in bytes
+def sizeof(value):
+    if hasattr(value, 'memory_usage'):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+    return sys.getsizeof(value)
+
+
+class TTLCache:
+    # Key/value cache with a time-to-live per entry and a total memory bound.
+    # Entries are evicted least recently used first once max_bytes is exceeded.
+    def __init__(self, ttl=600, max_bytes=512 * 1024 ** 2, sizer=sizeof):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizer = sizer
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def get(self, key, count=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizer(value)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            # Values larger than the whole budget are returned but never kept
+            if size > self.max_bytes:
+                return value
+            self._entries[key] = (value, time.monotonic() + self.ttl, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+        return value
+
+    # Return the cached value for key, calling load() to fill it on a miss
+    def get_or_load(self, key, load):
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, load())
+        return value
+
+    # Drop one entry, or every entry when no key is given
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self.nbytes = 0
+            elif key in self._entries:
+                self._drop(key)
+
+    def _drop(self, key):
+        self.nbytes -= self._entries.pop(key)[2]
+
+
+class ConnectionPool:
+    # Bounded pool of reusable database connections created by connect()
+    def __init__(self, connect, size=4, timeout=30):
+        self.connect = connect
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError('No database connection available')
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self.connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    # Return a connection to the pool, or close it if it is no longer usable
+    def release(self, conn, broken=False):
+        if broken:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        else:
+            self._idle.put(conn)
+        self._slots.release()
+
+    def connection(self):
+        return _PooledConnection(self)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class _PooledConnection:
+    # Context manager handing out a pooled connection for one query
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+
+    def __enter__(self):
+        self.conn = self.pool.acquire()
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.pool.release(self.conn, broken=exc_type is not None)
+        return False
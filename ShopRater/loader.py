@@ -0,0 +1,313 @@
+# Loading of the Shopee item data stored in HBase
+import os
+import pathlib
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from cache import ConnectionPool, TTLCache
+
+# The shdata package shared with dash-shope lives in the repository root
+APP_PATH = pathlib.Path(__file__).parent.resolve()
+sys.path.append(str(APP_PATH.parent))
+
+from shdata import ingest, schema, store, text  # noqa: E402
+from shdata.timing import timed  # noqa: E402
+from shdata.stats import Stats  # noqa: E402
+
+# Change the server address here to point to the HBase REST service
+CONNECTION_STRING = "Server=[::1];Port=8080;"
+
+# Parquet snapshots of each category, written by snapshot.py
+SNAPSHOT_DIR = pathlib.Path(os.environ.get(
+    'SHOPRATER_SNAPSHOTS', str(APP_PATH / 'snapshots')))
+
+# Scrape batches appended by python -m shdata.store, read in preference to
+# the snapshots for the categories they cover
+STORE_DIR = store.STORE_DIR
+
+df_cat = schema.CATEGORIES
+
+
+# The HBase driver is only imported once a connection is needed, so tools
+# working from snapshots run without it
+def connect():
+    import cdata.apachehbase as mod
+    return mod.connect(CONNECTION_STRING)
+
+
+# Connections are reused between queries instead of opened on every load
+POOL_SIZE = int(os.environ.get('SHOPRATER_POOL_SIZE', 4))
+pool = ConnectionPool(connect, size=POOL_SIZE)
+
+# Categories loaded at once, one connection each
+loaders = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix='load')
+
+# Category frames are kept for 10 minutes, within a 1GB memory budget
+frames = TTLCache(ttl=600, max_bytes=1024 ** 3)
+
+# Descriptive statistics of each category, which are only a few kB each
+summaries = TTLCache(ttl=600)
+
+# Frames and statistics of several categories together, keyed by the tuple
+# of categories
+selections = TTLCache(ttl=600, max_bytes=1024 ** 3)
+selection_stats = TTLCache(ttl=600)
+
+# Frames of a category with only some columns or rows, keyed by category,
+# columns and filters
+projections = TTLCache(ttl=600, max_bytes=1024 ** 3)
+
+# HBase column holding each field of the item schema
+HBASE_COLUMNS = {
+    'Category': 'Item:Category',
+    'Label': 'Item:Label',
+    'Stars': 'Item:Stars',
+    'Ratings': 'Item:Ratings',
+    'Sold': 'Item:Sold',
+    'PriceMin': 'Item:PriceMin',
+    'PriceMax': 'Item:PriceMax',
+    'Stock': 'Item:Stock',
+    'Seller': 'Seller:Name',
+    'SellerRatings': 'Seller:Ratings',
+    'Products': 'Seller:Products',
+    'ResponseRate': 'Seller:ResponseRate',
+    'ResponseTime': 'Seller:ResponseTime',
+    'Joined': 'Seller:Joined',
+    'Followers': 'Seller:Followers',
+    'URL': 'Item:URL',
+}
+
+NUMERIC = [c for c, kind in schema.FIELDS.items() if kind in ('int', 'float')]
+
+# Columns read by each section of the page. The rating model normalizes
+# all numeric columns of a row together, so it needs every one of them.
+SECTIONS = {
+    'predict': NUMERIC,
+    'plots': NUMERIC,
+    'similar': ['Label'],
+    'description': [c for c in schema.FIELDS if c != 'URL'],
+}
+
+# Row filters that can be pushed to the query, as the column and comparison
+FILTERS = {
+    'min_price': ('PriceMin', '>='),
+    'max_price': ('PriceMax', '<='),
+    'min_ratings': ('Ratings', '>='),
+}
+
+
+# Columns needed by the given page sections, in the order of the schema
+def section_columns(*sections):
+    needed = set().union(*(SECTIONS[s] for s in sections))
+    return [c for c in schema.FIELDS if c in needed]
+
+
+# Filters as (column, op, value) tuples, leaving out those set to None
+def filter_terms(filters):
+    return [FILTERS[name] + (value,) for name, value in sorted((filters or {}).items())
+            if value is not None]
+
+
+# SQL and parameters selecting the given columns (all by default) of a
+# category's rows passing the filters. Values are bound as parameters, so
+# the text only changes with the columns and filters used and the driver
+# can reuse the prepared statement.
+def category_query(cat, columns=None, filters=None):
+    select = ', '.join("{} as '{}'".format(HBASE_COLUMNS[c], c) for c in columns or HBASE_COLUMNS)
+    where = ['Item:Category = ?']
+    params = [cat]
+    for col, op, value in filter_terms(filters):
+        where.append('{} {} ?'.format(HBASE_COLUMNS[col], op))
+        params.append(value)
+    sql = 'SELECT {} FROM Shopee_Items WHERE {}'.format(select, ' AND '.join(where))
+    return sql, params
+
+
+# Page through the rows of a category in HBase as typed chunks
+def iter_hbase(cat, columns=None, filters=None):
+    sql, params = category_query(cat, columns, filters)
+    with pool.connection() as conn:
+        for chunk in ingest.iter_query(sql, conn, params=params):
+            yield chunk
+
+
+def query_df(cat, columns=None, filters=None):
+    # Import e-commerce data
+    # return pd.read_csv("data/mega.csv")
+    return ingest.frame(iter_hbase(cat, columns, filters), columns=columns)
+
+
+def stats_path(cat):
+    return ingest.snapshot_path(cat, SNAPSHOT_DIR).with_suffix('.stats')
+
+
+# Write the Parquet snapshot of a category straight from HBase, along with
+# its statistics gathered from the same chunks
+def save_snapshot(cat):
+    summary = Stats()
+    rows = ingest.write_snapshot(cat, summary.track(iter_hbase(cat)), SNAPSHOT_DIR)
+    summary.save(stats_path(cat))
+    return rows
+
+
+# The latest snapshot of the store when it holds the category, else None
+def stored(cat):
+    latest = store.latest(STORE_DIR)
+    return latest if latest is not None and cat in latest.parts else None
+
+
+# Newest store part each category was last read from
+read_parts = {}
+
+
+# Forget the cached data of a category once a newer scrape batch of it has
+# been appended to the store, so new batches show on the next page view
+def check_store(cat):
+    latest = stored(cat)
+    part = latest.parts[cat]['path'] if latest is not None else None
+    if read_parts.get(cat) != part:
+        invalidate(cat)
+        read_parts[cat] = part
+
+
+# Prefer the latest scrape batch in the store, then the snapshot of a
+# category, falling back to HBase without either. The data is held in the
+# compact schema types, with the cleaned label read in place of the raw
+# Label and without URL unless asked for. Only the given columns and the
+# rows passing the filters are read.
+def read_df(cat, columns=None, filters=None):
+    terms = filter_terms(filters)
+    latest = stored(cat)
+    if latest is not None:
+        df = latest.read_clean(cat, columns, terms)
+    else:
+        df = ingest.read_clean(cat, SNAPSHOT_DIR, columns=columns, filters=terms)
+    if df is None:
+        # Snapshots written before labels were cleaned at ingest, and HBase
+        df = ingest.read_snapshot(cat, SNAPSHOT_DIR, columns=columns, filters=terms)
+        if df is None:
+            df = query_df(cat, columns, filters)
+        if 'Label' in df.columns:
+            df['Label'] = text.clean_labels(df['Label'])[0]
+    return schema.apply_schema(df, keep=['Label'] + list(columns or []))
+
+
+# The whole category is cached under its name. Other selections reuse it
+# when it is already loaded and only some of its columns are needed.
+def cached_df(cat, columns=None, filters=None):
+    check_store(cat)
+    if columns is None and not filter_terms(filters):
+        return frames.get_or_load(cat, lambda: read_df(cat))
+    if not filter_terms(filters):
+        full = frames.get(cat, count=False)
+        if full is not None and all(c in full.columns for c in columns):
+            return full[list(columns)]
+    key = (cat, tuple(columns or ()), tuple(filter_terms(filters)))
+    return projections.get_or_load(key, lambda: read_df(cat, columns, filters))
+
+
+# Return the data for a category, only reading it on a cache miss. columns
+# limits the data to those columns, e.g. section_columns('predict'), and
+# filters keeps the rows passing them, e.g. {'min_price': 10}.
+# Callers get their own copy so in-place edits never reach the cache.
+@timed('load_df')
+def load_df(cat, columns=None, filters=None):
+    return cached_df(cat, columns, filters).copy()
+
+
+# Load several categories concurrently, yielding (category, frame) as each
+# one is ready, so the slowest category sets the wait rather than the sum
+def iter_load(cats, columns=None, filters=None):
+    futures = {loaders.submit(cached_df, cat, columns, filters): cat for cat in cats}
+    for future in as_completed(futures):
+        yield futures[future], future.result()
+
+
+# Concatenate category frames column by column, copying the data once.
+# Categorical columns get the union of the categories instead of falling
+# back to strings.
+def combine(parts):
+    parts = [df for df in parts if len(df.columns)]
+    if not parts:
+        return pd.DataFrame()
+    columns = {}
+    for col in parts[0].columns:
+        values = [df[col] for df in parts if col in df.columns]
+        if all(isinstance(v.dtype, pd.CategoricalDtype) for v in values):
+            columns[col] = union_categoricals(values)
+        else:
+            columns[col] = pd.concat(values, ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+# Return the data of several categories as one frame, with the columns
+# and filters of load_df. on_load(cat, df) is called as each category
+# arrives, e.g. to report progress. Callers get a shallow copy: columns can
+# be added or replaced without reaching the cache.
+@timed('load_many')
+def load_many(cats, on_load=None, columns=None, filters=None):
+    for cat in cats:
+        check_store(cat)
+
+    def load():
+        loaded = {}
+        for cat, df in iter_load(cats, columns, filters):
+            loaded[cat] = df
+            if on_load is not None:
+                on_load(cat, df)
+        return combine([loaded[cat] for cat in cats])
+    key = (tuple(cats), tuple(columns or ()), tuple(filter_terms(filters)))
+    return selections.get_or_load(key, load).copy(deep=False)
+
+
+# Return the statistics of a category, read from its latest scrape batch or
+# snapshot when there is one and otherwise computed from the loaded data
+def load_stats(cat):
+    check_store(cat)
+
+    def read_stats():
+        latest = stored(cat)
+        if latest is not None:
+            return latest.stats(cat)
+        path = stats_path(cat)
+        if path.exists():
+            return Stats.load(path)
+        return Stats.compute(load_df(cat))
+    return summaries.get_or_load(cat, read_stats)
+
+
+# Statistics of several categories, merged from those of each category
+def load_stats_many(cats):
+    for cat in cats:
+        check_store(cat)
+
+    def merge():
+        total = Stats()
+        for cat in cats:
+            total.merge(load_stats(cat))
+        return total
+    return selection_stats.get_or_load(tuple(cats), merge)
+
+
+# Forget cached data so the next load_df call fetches it again, along with
+# every selection of several categories
+def invalidate(cat=None):
+    frames.invalidate(cat)
+    summaries.invalidate(cat)
+    projections.invalidate()
+    selections.invalidate()
+    selection_stats.invalidate()
+
+
+# Fetch a category from HBase again, updating its snapshot if it has one
+def refresh(cat):
+    if ingest.snapshot_path(cat, SNAPSHOT_DIR).exists():
+        save_snapshot(cat)
+    invalidate(cat)
+
+
+def refresh_many(cats):
+    list(loaders.map(refresh, cats))
@@ -0,0 +1,267 @@
+# Persisted rating prediction models, one per category and data snapshot
+#
+# A model is identified by the category, a hash of the training data, the
+# regression engine and its settings, so it is trained once and then loaded
+# from disk until the data for that category or the settings change.
+import datetime
+import hashlib
+import importlib
+import io
+import json
+import os
+import pathlib
+import re
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from cache import TTLCache
+
+APP_PATH = pathlib.Path(__file__).parent.resolve()
+MODEL_DIR = pathlib.Path(os.environ.get(
+    'SHOPRATER_MODELS', str(APP_PATH / 'models')))
+
+# Bump this when the feature preparation changes to retire old models
+FORMAT_VERSION = 1
+
+PARAMS = {'n_estimators': 200, 'random_state': 0}
+
+# Regressors the rating model can be fitted with, as the module and class
+# to import and their default settings. The forest is the original model,
+# binned gradient boosting fits in a fraction of its time into a far
+# smaller model, and ridge regression is a linear baseline.
+ENGINES = {
+    'forest': ('sklearn.ensemble', 'RandomForestRegressor', PARAMS),
+    'boosting': ('sklearn.ensemble', 'HistGradientBoostingRegressor', {'max_iter': 200, 'random_state': 0}),
+    'ridge': ('sklearn.linear_model', 'Ridge', {'alpha': 1.0}),
+}
+
+# Engine used unless another one is asked for
+ENGINE = os.environ.get('SHOPRATER_ENGINE', 'forest')
+
+# Settings that change how fast a model is fitted but not the fitted model
+RUNTIME_PARAMS = ['n_jobs', 'verbose']
+
+# Columns that are not used as model inputs
+DROP_COLUMNS = ['Category', 'Label', 'Seller',
+                'ResponseTime', 'Joined', 'URL']
+
+# Positions of the input features and the expected outcome after normalizing
+FEATURES = [1, 2, 3, 4, 6, 8, 9]
+TARGET = [0]
+
+# Loaded models are kept in memory as well, so reruns skip the disk read
+loaded = TTLCache(ttl=3600, max_bytes=2 * 1024 ** 3,
+                  sizer=lambda entry: entry['size'])
+
+
+# Prepare the data for learning by removing variables with non-numerical values
+def numeric_frame(df):
+    return df.drop([c for c in DROP_COLUMNS if c in df.columns], axis=1)
+
+
+# Hash the training data so a model can be matched to the snapshot it came from
+def snapshot_hash(df):
+    df_ln = numeric_frame(df)
+    rows = pd.util.hash_pandas_object(df_ln, index=False)
+    digest = hashlib.sha1(rows.values.tobytes())
+    digest.update(','.join(map(str, df_ln.columns)).encode())
+    return digest.hexdigest()
+
+
+# Name of the data of a selection of categories: the category itself, or
+# for several a short hash of their sorted names, which stays a valid file
+# name however many are chosen
+def selection_name(cats):
+    if len(cats) == 1:
+        return cats[0]
+    return 'selection-' + hashlib.sha1('|'.join(sorted(cats)).encode()).hexdigest()[:12]
+
+
+def model_key(cat, data_hash, params, engine='forest'):
+    settings = {k: v for k, v in params.items() if k not in RUNTIME_PARAMS}
+    # Forests were stored before there were other engines, and keep their keys
+    if engine != 'forest':
+        settings['engine'] = engine
+    settings = json.dumps(settings, sort_keys=True)
+    key = '{}|{}|{}|{}'.format(FORMAT_VERSION, cat, data_hash, settings)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def model_path(cat, key, root=None):
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', cat).strip('-')
+    return pathlib.Path(root or MODEL_DIR) / slug / (key + '.joblib')
+
+
+def engine_params(engine, params=None):
+    if engine not in ENGINES:
+        raise ValueError('Unknown engine {!r}, expected one of {}'.format(engine, ', '.join(ENGINES)))
+    return dict(ENGINES[engine][2], **(params or {}))
+
+
+# An unfitted regressor of an engine. Runtime settings it does not have,
+# such as n_jobs for ridge, are left out. Serving only unpickles stored
+# models, so the fitting code is imported here.
+def regressor(engine, params):
+    module, name, _ = ENGINES[engine]
+    cls = getattr(importlib.import_module(module), name)
+    accepted = cls().get_params()
+    return cls(**{k: v for k, v in params.items() if k in accepted or k not in RUNTIME_PARAMS})
+
+
+# The normalized inputs and expected outcome, split 80/20 for fitting and
+# scoring
+def split(df):
+    from sklearn import preprocessing
+    from sklearn.model_selection import train_test_split
+
+    # Break down the variables into X and Y, with Y being the expected outcome
+    normalize = pd.DataFrame(preprocessing.normalize(numeric_frame(df)))
+    X = normalize.iloc[:, FEATURES].values
+    y = normalize.iloc[:, TARGET].values.ravel()
+
+    return train_test_split(X, y, test_size=0.2, random_state=0)
+
+
+# Fit a model on 80% of the data and score it on the other 20%
+def train(df, params=None, engine=None):
+    from sklearn import metrics
+
+    engine = engine or ENGINE
+    X_train, X_test, y_train, y_test = split(df)
+    model = regressor(engine, engine_params(engine, params))
+    model.fit(X_train, y_train)
+    pred_y = model.predict(X_test)
+
+    return model, metrics.r2_score(y_test, pred_y)
+
+
+# Fit time, prediction latency, stored size and R2 score of an engine on
+# the data of a category, to compare the engines with
+def evaluate(df, engine, params=None, repeat=20):
+    from sklearn import metrics
+
+    X_train, X_test, y_train, y_test = split(df)
+    model = regressor(engine, engine_params(engine, params))
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pred_y = model.predict(X_test)
+    batch_seconds = time.perf_counter() - start
+
+    # Scoring one listing, as the prediction page does
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model.predict(X_test[:1])
+        latencies.append(time.perf_counter() - start)
+
+    stored = io.BytesIO()
+    joblib.dump(model, stored)
+    return {'engine': engine,
+            'rows': len(df),
+            'score': metrics.r2_score(y_test, pred_y),
+            'fit_seconds': fit_seconds,
+            'predict_ms': sorted(latencies)[len(latencies) // 2] * 1000,
+            'batch_rows_per_second': len(X_test) / batch_seconds if batch_seconds else None,
+            'size_bytes': stored.tell()}
+
+
+def sklearn_version():
+    import sklearn
+    return sklearn.__version__
+
+
+# Write the model next to its metadata, replacing files atomically
+def save(path, entry):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    joblib.dump(entry, tmp)
+    os.replace(tmp, path)
+    meta = {k: v for k, v in entry.items() if k != 'model'}
+    path.with_suffix('.json').write_text(json.dumps(meta, indent=2))
+
+
+# Return the model entry for a category, training it only when no stored
+# model matches the current data, engine and settings. With fit=False a
+# missing model is not trained and None is returned instead.
+def get_model(cat, df, params=None, root=None, data_hash=None, engine=None, fit=True):
+    engine = engine or ENGINE
+    params = engine_params(engine, params)
+    data_hash = data_hash or snapshot_hash(df)
+    key = model_key(cat, data_hash, params, engine)
+
+    entry = loaded.get(key)
+    if entry is not None:
+        return entry
+
+    path = model_path(cat, key, root)
+    if path.exists():
+        entry = joblib.load(path)
+    elif not fit:
+        return None
+    else:
+        model, score = train(df, params, engine)
+        entry = {'model': model,
+                 'key': key,
+                 'score': score,
+                 'category': cat,
+                 'engine': engine,
+                 'data_hash': data_hash,
+                 'params': params,
+                 'rows': len(df),
+                 'format': FORMAT_VERSION,
+                 'sklearn': sklearn_version(),
+                 'trained_at': datetime.datetime.utcnow().isoformat()}
+        save(path, entry)
+    entry['size'] = path.stat().st_size
+    return loaded.put(key, entry)
+
+
+class Ensemble:
+    # Rating model of several categories, averaging the estimates of the
+    # models of each category weighted by the rows they were trained on
+
+    def __init__(self, entries):
+        self.models = [e['model'] for e in entries]
+        self.weights = [e['rows'] for e in entries]
+
+    def predict(self, X):
+        return np.average([m.predict(X) for m in self.models], axis=0, weights=self.weights)
+
+
+# Model entry for several categories, combining the stored models of each
+# category, with load(cat) returning the data of a category. Models are not
+# trained here: categories without a stored model are listed as missing and
+# left out, and None is returned when none has one. The score is the mean
+# of the categories' scores weighted by their rows.
+def get_models(cats, load, params=None, root=None, engine=None):
+    entries, missing = [], []
+    for cat in cats:
+        entry = get_model(cat, load(cat), params, root, engine=engine, fit=False)
+        if entry is None:
+            missing.append(cat)
+        else:
+            entries.append(entry)
+    if not entries:
+        return None
+    rows = sum(e['rows'] for e in entries)
+    return {'model': Ensemble(entries),
+            'score': sum(e['score'] * e['rows'] for e in entries) / rows,
+            'category': selection_name(cats),
+            'categories': [e['category'] for e in entries],
+            'missing': missing,
+            'rows': rows}
+
+
+# Remove stored models for a category that no longer match its latest data
+def prune(cat, keep, root=None):
+    for path in model_path(cat, keep, root).parent.glob('*.joblib'):
+        if path.stem != keep:
+            path.unlink()
+            if path.with_suffix('.json').exists():
+                path.with_suffix('.json').unlink()
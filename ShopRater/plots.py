@@ -0,0 +1,104 @@
+# Distribution plots of the numeric attributes of a category
+#
+# The plotted values (histogram bins, densities on a fixed grid and box plot
+# quartiles) are computed with NumPy and turned into Altair charts, which
+# are cached per category and data snapshot so repeat views skip the work.
+import altair as alt
+import numpy as np
+import pandas as pd
+
+from cache import TTLCache, sizeof
+
+BINS = 10
+GRID = 200
+
+# Densities are estimated from a random sample of this many rows at most
+KDE_ROWS = 5000
+
+# Charts are sized by the frame of plotted values they embed, the chart
+# objects themselves being small
+charts = TTLCache(ttl=3600, max_bytes=64 * 1024 ** 2,
+                  sizer=lambda chart: sizeof(chart.data))
+
+
+def numeric_columns(df):
+    return [c for c in df.select_dtypes('number').columns if df[c].notna().any()]
+
+
+def histogram_data(df):
+    parts = []
+    for col in numeric_columns(df):
+        counts, edges = np.histogram(df[col].dropna(), bins=BINS)
+        parts.append(pd.DataFrame({'column': col, 'start': edges[:-1],
+                                   'end': edges[1:], 'count': counts}))
+    return pd.concat(parts, ignore_index=True)
+
+
+# Gaussian kernel density on a fixed grid, with Scott's rule bandwidth
+def density_data(df, seed=0):
+    rng = np.random.RandomState(seed)
+    parts = []
+    for col in numeric_columns(df):
+        x = df[col].dropna().to_numpy(dtype=float)
+        if len(x) > KDE_ROWS:
+            x = rng.choice(x, KDE_ROWS, replace=False)
+        bw = x.std(ddof=1) * len(x) ** (-1 / 5) if len(x) > 1 else 0
+        if not bw > 0:
+            bw = 1.0
+        grid = np.linspace(x.min() - 3 * bw, x.max() + 3 * bw, GRID)
+        z = (grid[:, None] - x[None, :]) / bw
+        density = np.exp(-0.5 * z ** 2).sum(1) / (len(x) * bw * np.sqrt(2 * np.pi))
+        parts.append(pd.DataFrame({'column': col, 'value': grid, 'density': density}))
+    return pd.concat(parts, ignore_index=True)
+
+
+# Quartiles, whiskers at 1.5 IQR and the number of outliers of each column
+def box_data(df):
+    rows = []
+    for col in numeric_columns(df):
+        x = df[col].dropna().to_numpy(dtype=float)
+        q1, median, q3 = np.percentile(x, [25, 50, 75])
+        iqr = q3 - q1
+        inside = x[(x >= q1 - 1.5 * iqr) & (x <= q3 + 1.5 * iqr)]
+        rows.append({'column': col, 'q1': q1, 'median': median, 'q3': q3,
+                     'low': inside.min(), 'high': inside.max(),
+                     'outliers': int(len(x) - len(inside))})
+    return pd.DataFrame(rows)
+
+
+def facet(chart):
+    return chart.properties(width=180, height=140).facet(
+        facet=alt.Facet('column:N', title=None), columns=3
+    ).resolve_scale(x='independent', y='independent')
+
+
+def histogram_chart(df):
+    return facet(alt.Chart(histogram_data(df)).mark_bar(opacity=0.5).encode(
+        x=alt.X('start:Q', bin='binned', title=None),
+        x2='end:Q',
+        y=alt.Y('count:Q', title=None)
+    ))
+
+
+def density_chart(df):
+    return facet(alt.Chart(density_data(df)).mark_line().encode(
+        x=alt.X('value:Q', title=None),
+        y=alt.Y('density:Q', title=None)
+    ))
+
+
+def box_chart(df):
+    base = alt.Chart().encode(x=alt.X('column:N', title=None, axis=None))
+    whisker = base.mark_rule().encode(y=alt.Y('low:Q', title=None), y2='high:Q')
+    box = base.mark_bar(size=40).encode(y='q1:Q', y2='q3:Q',
+                                        tooltip=['q1:Q', 'median:Q', 'q3:Q', 'outliers:Q'])
+    median = base.mark_tick(color='white', size=40).encode(y='median:Q')
+    return facet(alt.layer(whisker, box, median, data=box_data(df)))
+
+
+# Return a cached chart of the given kind for a category's data
+def chart(kind, cat, version, df):
+    build = {'histogram': histogram_chart,
+             'density': density_chart,
+             'box': box_chart}[kind]
+    return charts.get_or_load((kind, cat, version), lambda: build(df))
@@ -1,54 +1,112 @@
 #!/bin/env python3
 
 # All data processing libraries
-import cdata.apachehbase as mod
-import numpy as np
+import io
+import os
+
 import pandas as pd
-from scipy import stats
 
 # All graphing libraries
 import altair as alt
-import seaborn as sns
-import matplotlib.pyplot as plt
-import matplotlib.font_manager
 
-# All machine learning libraries
-from sklearn import metrics
-from sklearn import model_selection
-from sklearn import preprocessing
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
+# The machine learning libraries are imported by model_store and batch,
+# with the training only modules loaded once a model has to be fitted
 
 import streamlit as st
 
+import batch
+import model_store
+import plots
+import warmup
+from loader import df_cat, load_df, load_many, load_stats, load_stats_many, refresh_many, section_columns
+from shdata import timing
+from shdata.stats import Stats
+from shdata.timing import timed
+
+# Stage latencies are served for Prometheus on this port
+timing.serve_metrics(int(os.environ.get('SHOPRATER_METRICS_PORT', 9108)))
+
+# Load the other categories and their models in the background, so only
+# the first page view after a start waits for data
+warmup.preload()
+
 '''
 # Shopee Product Analytics
 
 This is a tool to view item data that was mined from all Shopee categories.
 The list of categories are available on the left and can be used to select the product category you would like to see.
+Several categories, or all of them, can also be analysed together.
 '''
 
-
-def load_df(cat):
-    # Import e-commerce data
-    # return pd.read_csv("data/mega.csv")
-    cat = cat.replace("'", "''")
-    conn = mod.connect("Server=[::1];Port=8080;")
-    query = r"SELECT Item:Category as 'Category', Item:Label as 'Label', Item:Stars as 'Stars', Item:Ratings as 'Ratings', Item:Sold as 'Sold', Item:PriceMin as 'PriceMin', Item:PriceMax as 'PriceMax', Item:Stock as 'Stock', Seller:Name as 'Seller', Seller:Ratings as 'SellerRatings', Seller:Products as 'Products', Seller:ResponseRate as 'ResponseRate', Seller:ResponseTime as 'ResponseTime', Seller:Joined as 'Joined', Seller:Followers as 'Followers', Item:URL as 'URL', FROM Shopee_Items WHERE Item:Category = ('" + \
-        cat + r"')"
-    return pd.read_sql(query, conn)
-
-
-df_cat = [r"Automotive", r"Baby & Toys", r"Cameras & Drones", r"Computer & Accessories", r"Fashion Accessories", r"Games, Books & Hobbies", r"Gaming & Consoles", r"Groceries & Pets", r"Health & Beauty", r"Home Appliances", r"Home & Living",
-          r"Men's Bags & Wallets", r"Men's Clothing", r"Men's Shoes", r"Mobile & Gadgets", r"Muslim Fashion", r"Sports & Outdoor", r"Tickets & Vouchers", r"Travel & Luggage", r"Watches", r"Women's Bags", r"Women's Clothing", r"Women's Shoes", r"Others"]
+SEVERAL = 'Several categories'
+ALL = 'All categories'
 
 option_df = st.sidebar.selectbox(
-    'Choose the product category', df_cat)
-
-df = load_df(option_df)
-
-# Remove all non-latin characters from the label
-df['Label'] = df['Label'].str.replace(r"[^a-zA-Z0-9_\s]+", " ").str.strip()
+    'Choose the product category', df_cat + [SEVERAL, ALL])
+
+if option_df == ALL:
+    cats = df_cat
+elif option_df == SEVERAL:
+    cats = st.sidebar.multiselect('Categories to analyse together', df_cat, default=df_cat[:2])
+else:
+    cats = [option_df]
+
+if not cats:
+    st.warning('Choose at least one category.')
+    st.stop()
+
+# Names the selection in the cached plots
+option_df = model_store.selection_name(cats)
+
+# Only listings passing these filters are read, the filters being applied by
+# HBase or the snapshot reader. A value of 0 leaves the filter out.
+with st.sidebar.expander('Filter listings'):
+    filters = {'min_price': st.number_input('Minimum price (RM)', min_value=0.0, value=0.0),
+               'max_price': st.number_input('Maximum price (RM), 0 for none', min_value=0.0, value=0.0),
+               'min_ratings': st.number_input('Minimum item ratings', min_value=0, value=0)}
+filters = {name: value or None for name, value in filters.items()}
+filtered = any(v is not None for v in filters.values())
+
+# Read the categories from HBase again instead of the cached copies
+if st.sidebar.button('Reload data'):
+    refresh_many(cats)
+
+# Only the columns used by the sections below are read
+columns = section_columns('predict', 'plots', 'similar')
+
+if len(cats) == 1:
+    df = load_df(cats[0], columns, filters)
+    df_stats = load_stats(cats[0])
+else:
+    # The categories are fetched concurrently, and listed as they arrive
+    progress = st.progress(0.0)
+    arrived = st.empty()
+    rows = {}
+
+    def loaded(cat, part):
+        rows[cat] = len(part)
+        progress.progress(len(rows) / len(cats))
+        arrived.table(pd.Series(rows, name='Rows').rename_axis('Category').reset_index())
+
+    df = load_many(cats, on_load=loaded, columns=columns, filters=filters)
+    df_stats = load_stats_many(cats)
+    progress.empty()
+    arrived.empty()
+
+# The stored statistics cover whole categories
+if filtered and len(df):
+    df_stats = Stats.compute(df)
+
+# Identifies this version of the data for the cached plots
+df_version = model_store.snapshot_hash(df)
+
+# The rating model is trained on the whole category, so changing the
+# filters never trains another one
+if len(cats) == 1 and filtered:
+    model_df = load_df(cats[0], columns)
+    model_version = model_store.snapshot_hash(model_df)
+else:
+    model_df, model_version = df, df_version
 
 '''
 # Rating prediction tool
@@ -60,40 +118,27 @@ You could then input your own data to see the rating that would predicted if you
 '''
 
 
-def predict(df):
-    # Perform normalization of the data
-    df_ln = df.copy()
-
-    # Prepare the data for learning by removing variables with non-numerical values
-    df_ln.drop(['Category'], axis=1, inplace=True)
-    df_ln.drop(['Label'], axis=1, inplace=True)
-    df_ln.drop(['Seller'], axis=1, inplace=True)
-    df_ln.drop(['ResponseTime'], axis=1, inplace=True)
-    df_ln.drop(['Joined'], axis=1, inplace=True)
-    df_ln.drop(['URL'], axis=1, inplace=True)
-    # Get a data description of the normalized data set
-    # st.table(df_ln.describe())
-
-    # Break down the variables into X and Y, with Y being the expected outcome
-    normalize = pd.DataFrame(preprocessing.normalize(df_ln))
-    X = normalize.iloc[:, [1, 2, 3, 4, 6, 8, 9]].values
-    y = normalize.iloc[:, [0]].values
-
-    # Divide the data into 80% for training and 20% for testing
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=0)
-
-    # Initialize the random forrest regressor for training
-    rnd_f = RandomForestRegressor(n_estimators=200, random_state=0)
-
-    # Fit the training data into the model for training
-    rnd_f.fit(X_train, y_train.ravel())
-    # We then perform the prediction using the test data
-    pred_y = rnd_f.predict(X_test)
+@timed('predict')
+def predict(df, cats, version):
+    if len(cats) == 1:
+        # Load the model trained on this category's data, training it only
+        # if the data has changed since the stored model was built
+        entry = model_store.get_model(cats[0], df, data_hash=version)
+    else:
+        # Several categories are estimated with the stored model of each
+        # category, which train.py and warmup.py build ahead of time
+        entry = model_store.get_models(cats, lambda cat: load_df(cat, columns))
+        if entry is None:
+            st.info('No rating model has been trained for these categories yet, run `python train.py` first.')
+            return
+        if entry['missing']:
+            st.info('The estimates leave out ' + ', '.join(entry['missing']) +
+                    ', which have no trained model yet.')
+    rnd_f = entry['model']
 
     # Print the prediction score or accuracy
     st.write("Prediction accuracy: " +
-             str(round(metrics.r2_score(y_test, pred_y) * 100, 4)) + '%')
+             str(round(entry['score'] * 100, 4)) + '%')
 
     sprice = st.text_input('Minimum Price (RM)', 10)
     bprice = st.text_input('Maximum Price (RM)', 50)
@@ -115,12 +160,43 @@ def predict(df):
               'ResponseRate': [sresponse],
               'Followers': [followers]}
     df_u = pd.DataFrame(sample)
-    pred_u = rnd_f.predict(pd.DataFrame(preprocessing.normalize(df_u)))
-    npv = (1 - pred_u[0]) * 5
+    npv = batch.predict_stars(rnd_f, df_u)[0]
     st.text("\nItem rating estimate (Stars): " + str(round(npv, 2)))
 
+    st.write("To estimate the rating of many items at once, upload a CSV or Parquet file with one item per row and the columns " +
+             ", ".join(batch.FEATURES) + ". The ResponseRate is a fraction, e.g. 0.9 for 90%.")
+    upload = st.file_uploader('Items to score', type=['csv', 'parquet'])
+    if upload is not None:
+        out = io.StringIO()
+        batch.write_csv(batch.score_chunks(
+            rnd_f, batch.read_chunks(upload, upload.name)), out)
+        st.download_button('Download estimates', out.getvalue(),
+                           file_name='estimates.csv', mime='text/csv')
+
+
+predict(model_df, cats, model_version)
 
-predict(df)
+'''
+# Similar listings
+
+Find the listings of all categories whose labels are most like a label of your own, to see how comparable items are rated, priced and selling.
+'''
+
+if st.checkbox('Show similar listings'):
+    # The label index and scipy.sparse are only loaded once asked for
+    import similar
+    index = similar.current()
+    if index is None:
+        st.info('The similar listings index has not been built yet, run `python similar.py build` first.')
+    else:
+        label = st.text_input('Item label', df['Label'].iloc[0] if len(df) else '')
+        with timed('similar'):
+            st.table(index.query(label, 10))
+
+# The analysis below needs listings, which the filters can leave none of
+if not len(df):
+    st.info('No listings pass the filters, change them to see the analysis of the data.')
+    st.stop()
 
 '''
 # Product attributes analysis
@@ -133,23 +209,25 @@ if st.checkbox('Show data description'):
     '''
     View the first 10 rows of this dataset.
     '''
-    st.write(df.head(10))
+    if len(cats) == 1:
+        st.write(load_df(cats[0], section_columns('description'), filters).head(10))
+    else:
+        st.write(load_many(cats, columns=section_columns('description'), filters=filters).head(10))
     '''
     Get a data description of the dataset for this category.
     '''
-    st.write(df.describe())
+    st.write(df_stats.describe())
     '''
     Identify attributes that contain null values
     '''
-    st.text(df.isnull().sum())
-
-# Remove the URL an ID field, since we do not need it
-df.drop(['URL'], axis=1, inplace=True)
+    st.text(df_stats.nulls)
 
-# Correlation analysis between attributes in the data set
-df_corr = df.corr().stack().reset_index().rename(
-    columns={0: 'correlation', 'level_0': 'Y', 'level_1': 'X'})
-df_corr['correlation_label'] = df_corr['correlation'].map('{:.3f}'.format)
+# Correlation analysis between attributes in the data set, from the
+# precomputed statistics of this category
+with timed('correlation'):
+    df_corr = df_stats.corr().stack().reset_index().rename(
+        columns={0: 'correlation', 'level_0': 'Y', 'level_1': 'X'})
+    df_corr['correlation_label'] = df_corr['correlation'].map('{:.3f}'.format)
 
 if st.checkbox('Show correlation sample'):
     '''
@@ -183,28 +261,26 @@ cor_plot = base.mark_rect().encode(
 )
 
 # The '+' means overlaying the text and rect layer
-st.altair_chart(cor_plot + text, use_container_width=True)
+with timed('plot_correlation'):
+    st.altair_chart(cor_plot + text, use_container_width=True)
 
 '''
 Plots showing the distribution of data for each variable.
 '''
 # Histogram plots of all variables
-df.hist(alpha=0.5, figsize=(15, 15))
-plt.tight_layout()
-st.pyplot()
+with timed('plot_histogram'):
+    st.altair_chart(plots.chart('histogram', option_df, df_version, df))
 
 '''
 Plots showing the density of data for each variable.
 '''
 # Density plots of all variables
-df.plot(kind='density', subplots=True, layout=(
-    4, 3), sharex=False, figsize=(15, 15))
-st.pyplot()
+with timed('plot_density'):
+    st.altair_chart(plots.chart('density', option_df, df_version, df))
 
 '''
 Lastly, the box plots of the variables to see the outliers (extreme values) and concentration of the data.
 '''
 # Box plots of all variables
-df.plot(kind='box', subplots=True, layout=(4, 3),
-        sharex=False, sharey=False, figsize=(15, 15))
-st.pyplot()
+with timed('plot_box'):
+    st.altair_chart(plots.chart('box', option_df, df_version, df))
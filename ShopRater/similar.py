@@ -0,0 +1,253 @@
+#!/bin/env python3
+
+# Search for listings with labels similar to a given one, across categories.
+#
+# Build the index from the category snapshots, then query it:
+#   python similar.py build
+#   python similar.py query "helmet visor clear"
+#
+# Labels are turned into TF-IDF weighted vectors of hashed character
+# trigrams, and each vector into a 256 bit signature of random hyperplane
+# signs, so similar labels get signatures differing in few bits. Listings
+# with a byte of the signature equal to the query's, or one bit away from it,
+# are candidates, and the closest signatures among them are scored by exact
+# cosine similarity with the stored vectors.
+import argparse
+import functools
+import json
+import os
+import pathlib
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+APP_PATH = pathlib.Path(__file__).parent.resolve()
+INDEX_DIR = pathlib.Path(os.environ.get(
+    'SHOPRATER_SIMILAR', str(APP_PATH / 'similar')))
+
+COLUMNS = ['Category', 'Label', 'Stars', 'Sold', 'PriceMin', 'PriceMax']
+
+FEATURES = 2 ** 17
+BITS = 256
+SEED = 0
+
+# Characters of a label used, and labels hashed at once
+WIDTH = 120
+CHUNK_ROWS = 100000
+
+# Signatures scored exactly per query
+CANDIDATES = 5000
+
+# Band values one bit away from a band value
+PROBES = (1 << np.arange(8)).astype(np.uint8)
+
+
+
+# Row and feature of every character trigram of the lower cased labels,
+# with a space added before and after each label
+def trigrams(labels):
+    text = [' ' + label.lower() + ' ' if isinstance(label, str) else ' '
+            for label in labels]
+    width = min(WIDTH, max(map(len, text), default=3))
+    codes = np.array(text, dtype='U%d' % width).view(np.uint32)
+    codes = codes.reshape(len(text), width).astype(np.uint64)
+    h = (codes[:, :-2] * np.uint64(1000003)) ^ codes[:, 1:-1]
+    h = (h * np.uint64(1000003)) ^ codes[:, 2:]
+    rows, cols = np.nonzero(codes[:, 2:])
+    return rows, (h[rows, cols] % np.uint64(FEATURES)).astype(np.int64)
+
+
+# Sublinear term frequencies, one row per label
+def term_frequencies(labels):
+    rows, features = trigrams(labels)
+    tf = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, features)),
+                           shape=(len(labels), FEATURES))
+    tf.sum_duplicates()
+    tf.data = 1 + np.log(tf.data)
+    return tf
+
+
+# L2 normalized TF-IDF vectors
+def vectors(labels, idf):
+    X = term_frequencies(labels)
+    X.data *= idf[X.indices]
+    rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+    norms = np.sqrt(np.bincount(rows, X.data ** 2, minlength=X.shape[0]))
+    X.data /= norms[rows]
+    return X
+
+
+# BITS / 8 bytes per row
+def signatures(X, projection):
+    return np.packbits(np.asarray(X @ projection) > 0, axis=1)
+
+
+# Bits set in each 64 bit word
+def popcount(x):
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0f0f0f0f0f0f0f0f)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+def hamming(a, b):
+    words = np.bitwise_xor(a, b).view(np.uint64)
+    return popcount(words).sum(1)
+
+
+# Positions start to stop of every span, one after the other
+def spans(starts, stops):
+    counts = stops - starts
+    return np.repeat(stops - counts.cumsum(), counts) + np.arange(counts.sum())
+
+
+# Write the index of the given listings, replacing the previous one
+def build(items, root=INDEX_DIR):
+    root = pathlib.Path(root)
+    items = items[COLUMNS].reset_index(drop=True)
+    items['Label'] = items['Label'].astype(str)
+    labels = items['Label']
+
+    # Document frequencies first, then the signatures chunk by chunk
+    df = np.zeros(FEATURES, dtype=np.int64)
+    for start in range(0, len(labels), CHUNK_ROWS):
+        tf = term_frequencies(labels.iloc[start:start + CHUNK_ROWS])
+        df += np.bincount(tf.indices, minlength=FEATURES)
+    idf = (np.log((1 + len(labels)) / (1 + df)) + 1).astype(np.float32)
+    # Drawn in chunks, a float64 draw of all of it would double the memory used
+    projection = np.empty((FEATURES, BITS), dtype=np.float32)
+    state = np.random.RandomState(SEED)
+    for start in range(0, FEATURES, 2 ** 13):
+        projection[start:start + 2 ** 13] = state.standard_normal((2 ** 13, BITS))
+    X = sparse.vstack([vectors(labels.iloc[start:start + CHUNK_ROWS], idf)
+                       for start in range(0, len(labels), CHUNK_ROWS)]
+                      or [sparse.csr_matrix((0, FEATURES), dtype=np.float32)], format='csr')
+    sigs = np.concatenate([signatures(X[start:start + CHUNK_ROWS], projection)
+                           for start in range(0, len(labels), CHUNK_ROWS)]
+                          or [np.zeros((0, BITS // 8), np.uint8)])
+
+    # Each byte is a band, sorted so its members are found with a binary search
+    bands = sigs.T
+    band_rows = np.argsort(bands, axis=1, kind='stable').astype(np.int32)
+    band_keys = np.take_along_axis(bands, band_rows, axis=1)
+
+    tmp = root.with_name(root.name + '.tmp')
+    shutil.rmtree(str(tmp), ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for name, array in (('signatures', sigs), ('band_keys', band_keys), ('band_rows', band_rows),
+                        ('idf', idf), ('projection', projection), ('vector_data', X.data),
+                        ('vector_indices', X.indices), ('vector_indptr', X.indptr)):
+        np.save(str(tmp / (name + '.npy')), array)
+    items.to_parquet(str(tmp / 'items.parquet'), index=False)
+    (tmp / 'manifest.json').write_text(json.dumps({
+        'rows': len(items), 'features': FEATURES, 'bits': BITS,
+        'built': time.strftime('%Y-%m-%d %H:%M:%S')}, indent=2))
+    old = root.with_name(root.name + '.old')
+    if root.exists():
+        os.rename(str(root), str(old))
+    os.rename(str(tmp), str(root))
+    shutil.rmtree(str(old), ignore_errors=True)
+    return len(items)
+
+
+class SimilarIndex:
+
+    def __init__(self, root=INDEX_DIR):
+        root = pathlib.Path(root)
+        for name in ('signatures', 'band_keys', 'band_rows', 'idf', 'projection',
+                     'vector_data', 'vector_indices', 'vector_indptr'):
+            # Plain arrays over the mapped files, memmap slices are slow to make
+            setattr(self, name, np.asarray(np.load(str(root / (name + '.npy')), mmap_mode='r')))
+        # Plain NumPy columns are the quickest to take a few rows from
+        items = pd.read_parquet(str(root / 'items.parquet'))
+        self.columns = {c: items[c].to_numpy(dtype=object if c in ('Category', 'Label') else None)
+                        for c in COLUMNS}
+
+    # Rows with a band equal to the signature's or one bit away from it, or
+    # every row when too few are
+    def candidates(self, sig, n):
+        starts, stops = [], []
+        for band, key in enumerate(sig):
+            keys = np.r_[key, key ^ PROBES]
+            offset = band * self.band_keys.shape[1]
+            starts.append(offset + np.searchsorted(self.band_keys[band], keys, side='left'))
+            stops.append(offset + np.searchsorted(self.band_keys[band], keys, side='right'))
+        found = np.zeros(len(self.signatures), dtype=bool)
+        found[self.band_rows.ravel()[spans(np.concatenate(starts), np.concatenate(stops))]] = True
+        rows = np.flatnonzero(found)
+        if len(rows) < n:
+            rows = np.arange(len(self.signatures))
+        return rows
+
+    # Cosine similarity of the given rows with the vector x
+    def scores(self, rows, x):
+        starts, stops = self.vector_indptr[rows], self.vector_indptr[rows + 1]
+        take = spans(starts, stops)
+        X = sparse.csr_matrix((self.vector_data[take], self.vector_indices[take],
+                               np.r_[0, (stops - starts).cumsum()]), shape=(len(rows), FEATURES))
+        return X @ x.toarray().ravel()
+
+    # The n listings most similar to a label, with a Similarity column
+    def query(self, label, n=10):
+        x = vectors([label], self.idf)
+        if not len(self.signatures) or not x.nnz:
+            return pd.DataFrame(columns=COLUMNS + ['Similarity'])
+        features = np.unique(x.indices)
+        sig = signatures(x[:, features], self.projection[features])[0]
+
+        rows = self.candidates(sig, n)
+        if len(rows) > CANDIDATES:
+            distance = hamming(np.asarray(self.signatures[rows]), sig)
+            rows = rows[np.argpartition(distance, CANDIDATES - 1)[:CANDIDATES]]
+        score = self.scores(rows, x)
+        best = np.argsort(-score, kind='stable')[:n]
+        best = best[score[best] > 0]
+        found = pd.DataFrame({c: values[rows[best]] for c, values in self.columns.items()})
+        return found.assign(Similarity=score[best].round(3))
+
+
+@functools.lru_cache(maxsize=2)
+def open_index(root, built):
+    return SimilarIndex(root)
+
+
+# The index under root, reopened when it has been rebuilt, or None when it
+# has not been built yet
+def current(root=INDEX_DIR):
+    try:
+        built = (pathlib.Path(root) / 'manifest.json').stat().st_mtime
+    except FileNotFoundError:
+        return None
+    return open_index(str(root), built)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find listings with similar labels.')
+    commands = parser.add_subparsers(dest='command')
+    build_cmd = commands.add_parser('build', help='index the snapshots of all categories')
+    build_cmd.add_argument('categories', nargs='*', help='categories to index (default: all)')
+    query_cmd = commands.add_parser('query', help='print the listings most like a label')
+    query_cmd.add_argument('label')
+    query_cmd.add_argument('-n', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        import loader
+        start = time.perf_counter()
+        frames = [loader.load_df(cat)[COLUMNS] for cat in args.categories or loader.df_cat]
+        rows = build(pd.concat(frames, ignore_index=True))
+        print('{} listings indexed in {:.1f}s'.format(rows, time.perf_counter() - start))
+    elif args.command == 'query':
+        start = time.perf_counter()
+        result = SimilarIndex().query(args.label, args.n)
+        print(result.to_string())
+        print('{:.1f}ms'.format((time.perf_counter() - start) * 1000))
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+#!/bin/env python3
+
+# Export each category from HBase into a Parquet snapshot, which the web
+# application then reads instead of querying HBase:
+#
+#   python snapshot.py               # all categories
+#   python snapshot.py Automotive    # selected categories only
+import argparse
+import time
+
+import loader
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write a Parquet snapshot of each category.')
+    parser.add_argument('categories', nargs='*', default=loader.df_cat,
+                        help='categories to export (default: all)')
+    args = parser.parse_args()
+
+    for cat in args.categories:
+        start = time.perf_counter()
+        rows = loader.save_snapshot(cat)
+        print('{:<24} {:>8} rows  {:6.1f}s'.format(
+            cat, rows, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
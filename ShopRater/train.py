@@ -0,0 +1,169 @@
+#!/bin/env python3
+
+# Offline training of the rating prediction models for every category.
+# Run this before deploying so the web application starts with warm models:
+#
+#   python train.py                  # all categories
+#   python train.py Automotive       # selected categories only
+#   python train.py --engine boosting
+#
+# Categories are loaded and trained in parallel worker processes, and the
+# models are written to the same store predict() reads from.
+#
+# To choose an engine, compare them all on each category instead, writing
+# the fit time, prediction latency, model size and R2 score to engines.json
+# in the model directory:
+#
+#   python train.py --compare --min-score 0.8
+import argparse
+import datetime
+import json
+import os
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import model_store
+from loader import df_cat, load_df
+
+
+# Load and train one category, returning a summary of the run
+def train_category(cat, root=None, threads=1, prune=False, engine=None):
+    start = time.perf_counter()
+    df = load_df(cat)
+    loaded = time.perf_counter()
+    entry = model_store.get_model(cat, df, {'n_jobs': threads}, root=root, engine=engine)
+    if prune:
+        model_store.prune(cat, entry['key'], root=root)
+    return {'category': cat,
+            'engine': entry.get('engine', 'forest'),
+            'rows': entry['rows'],
+            'score': entry['score'],
+            'key': entry['key'],
+            'load_seconds': loaded - start,
+            'train_seconds': time.perf_counter() - loaded,
+            'trained_at': entry['trained_at']}
+
+
+# Fit every engine on one category without storing the models
+def compare_category(cat, threads=1, engines=None):
+    df = load_df(cat)
+    return {'category': cat,
+            'engines': [model_store.evaluate(df, engine, {'n_jobs': threads})
+                        for engine in engines or model_store.ENGINES]}
+
+
+# The engine quickest to fit among those scoring at least min_score
+def cheapest(results, min_score):
+    good = [r for r in results if r['score'] >= min_score]
+    return min(good, key=lambda r: r['fit_seconds'])['engine'] if good else None
+
+
+# Load and train categories in worker processes, printing each one as it
+# finishes. Returns the summaries of the trained categories, the failed
+# categories, and the workers and threads used.
+def train_all(categories, root=None, workers=None, threads=None, prune=False, engine=None):
+    # Share the cores between the worker processes and the forests they fit
+    cpus = os.cpu_count() or 1
+    workers = workers or min(len(categories), cpus)
+    threads = threads or max(1, cpus // workers)
+
+    results, failed = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = {pool.submit(train_category, cat, root, threads, prune, engine): cat
+                for cat in categories}
+        for job in as_completed(jobs):
+            try:
+                res = job.result()
+            except Exception as e:
+                failed.append(jobs[job])
+                print('{:<24} failed: {}'.format(jobs[job], e))
+                continue
+            results.append(res)
+            print('{:<24} {:<9} {:>8} rows  R2 {:.4f}  load {:6.1f}s  train {:6.1f}s'.format(
+                res['category'], res['engine'], res['rows'], res['score'],
+                res['load_seconds'], res['train_seconds']))
+    return results, failed, workers, threads
+
+
+def compare(args, workers, threads):
+    results, failed = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = {pool.submit(compare_category, cat, threads): cat for cat in args.categories}
+        for job in as_completed(jobs):
+            try:
+                res = job.result()
+            except Exception as e:
+                failed.append(jobs[job])
+                print('{:<24} failed: {}'.format(jobs[job], e))
+                continue
+            res['choice'] = cheapest(res['engines'], args.min_score)
+            results.append(res)
+            for r in res['engines']:
+                print('{:<24} {:<9} {:>8} rows  R2 {:.4f}  fit {:7.2f}s  predict {:7.2f}ms  {:8.1f}MB'.format(
+                    res['category'], r['engine'], r['rows'], r['score'], r['fit_seconds'],
+                    r['predict_ms'], r['size_bytes'] / 1024 ** 2))
+            print('{:<24} choice: {}'.format(res['category'], res['choice'] or 'none meets R2 {}'.format(args.min_score)))
+    return results, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Train and store the rating model for each category.')
+    parser.add_argument('categories', nargs='*', default=df_cat,
+                        help='categories to train (default: all)')
+    parser.add_argument('--models', default=None,
+                        help='model directory (default: ' +
+                        str(model_store.MODEL_DIR) + ')')
+    parser.add_argument('--prune', action='store_true',
+                        help='delete stored models for older data snapshots')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of categories trained at once')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='threads used by each forest (n_jobs)')
+    parser.add_argument('--engine', choices=list(model_store.ENGINES), default=model_store.ENGINE,
+                        help='regression engine (default: ' + model_store.ENGINE + ')')
+    parser.add_argument('--compare', action='store_true',
+                        help='compare all engines on each category instead of storing models')
+    parser.add_argument('--min-score', type=float, default=0.0,
+                        help='R2 score an engine needs to be chosen by --compare')
+    args = parser.parse_args()
+
+    root = pathlib.Path(args.models or model_store.MODEL_DIR)
+    root.mkdir(parents=True, exist_ok=True)
+    if args.compare:
+        # Share the cores between the worker processes and the forests they fit
+        cpus = os.cpu_count() or 1
+        workers = args.workers or min(len(args.categories), cpus)
+        threads = args.threads or max(1, cpus // workers)
+        start = time.perf_counter()
+        results, failed = compare(args, workers, threads)
+        report = {'finished_at': datetime.datetime.utcnow().isoformat(),
+                  'seconds': time.perf_counter() - start,
+                  'min_score': args.min_score,
+                  'failed': failed,
+                  'categories': sorted(results, key=lambda r: r['category'])}
+        (root / 'engines.json').write_text(json.dumps(report, indent=2))
+        return 1 if failed else 0
+
+    start = time.perf_counter()
+    results, failed, workers, threads = train_all(
+        args.categories, args.models, args.workers, args.threads, args.prune, args.engine)
+    elapsed = time.perf_counter() - start
+    print('Trained {} categories in {:.1f}s ({} workers x {} threads)'.format(
+        len(results), elapsed, workers, threads))
+
+    # Keep a report of the run next to the models
+    report = {'finished_at': datetime.datetime.utcnow().isoformat(),
+              'seconds': elapsed,
+              'workers': workers,
+              'threads': threads,
+              'engine': args.engine,
+              'failed': failed,
+              'categories': sorted(results, key=lambda r: r['category'])}
+    (root / 'report.json').write_text(json.dumps(report, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
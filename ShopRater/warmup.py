@@ -0,0 +1,75 @@
+#!/bin/env python3
+
+# Warm-up of the category data and rating models.
+#
+# Run before the server starts (the Docker image does this) to write any
+# missing snapshots, then train the missing models in parallel worker
+# processes as train.py does:
+#   python warmup.py
+#
+# sh_app.py also calls preload() once per server process, which loads the
+# snapshots, statistics and stored models of every category into memory in
+# a background thread. It only trains missing models when SHOPRATER_WARMUP_TRAIN
+# is set, as that competes with the page views for the cores.
+# SHOPRATER_WARMUP limits both to a comma separated list of categories.
+import functools
+import os
+import threading
+import time
+
+import model_store
+from loader import SNAPSHOT_DIR, df_cat, load_df, load_stats, save_snapshot
+from shdata import ingest
+
+TRAIN = bool(os.environ.get('SHOPRATER_WARMUP_TRAIN'))
+
+
+def categories():
+    names = os.environ.get('SHOPRATER_WARMUP')
+    return [c.strip() for c in names.split(',')] if names else df_cat
+
+
+# Load one category and its stored model into the in-memory caches,
+# training the model when it is missing only if fit is set
+def warm(cat, fit=False):
+    model_store.get_model(cat, load_df(cat), fit=fit)
+    load_stats(cat)
+
+
+@functools.lru_cache(maxsize=None)
+def preload():
+    def run():
+        for cat in categories():
+            try:
+                warm(cat, TRAIN)
+            except Exception as e:
+                print('Warm-up of {} failed: {}'.format(cat, e))
+    thread = threading.Thread(target=run, name='warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    ready = []
+    for cat in categories():
+        start = time.perf_counter()
+        try:
+            if not ingest.snapshot_path(cat, SNAPSHOT_DIR).exists():
+                save_snapshot(cat)
+        except Exception as e:
+            print('{:<24} failed: {}'.format(cat, e))
+            continue
+        ready.append(cat)
+        print('{:<24} snapshot ready in {:.1f}s'.format(cat, time.perf_counter() - start))
+
+    # Stored models are kept, so only the missing ones are trained
+    if ready:
+        import train
+        start = time.perf_counter()
+        results, failed, workers, threads = train.train_all(ready)
+        print('Models of {} categories ready in {:.1f}s ({} workers x {} threads)'.format(
+            len(results), time.perf_counter() - start, workers, threads))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+# Offline benchmarks for the data handling used by the web applications
@@ -0,0 +1,71 @@
+# Compare the row-wise ResponseHour computation with shdata.transform
+#
+#   python -m benchmarks.bench_transform --data dash-shope/data --repeat 24
+#
+# Every CSV in the data folder is loaded as one category. --repeat stacks the
+# data that many times to stand in for the full multi-category dataset.
+import argparse
+import glob
+import os
+import timeit
+
+import pandas as pd
+
+from shdata import transform
+
+
+# The original per-row conversion from the Dash application
+def transform_time(response_rate, response_time):
+    if response_time == 'hours':
+        return response_rate
+    elif response_time == 'days':
+        a = response_rate * 24
+        return a
+    elif response_time == 'minutes':
+        a = response_rate / 60
+        return a
+
+
+def rowwise(df):
+    return df.apply(lambda x: transform_time(x['ResponseRate'], x['ResponseTime']), axis=1)
+
+
+def vectorized(df):
+    return transform.response_hours(df['ResponseRate'], df['ResponseTime'])
+
+
+def load(data, repeat):
+    files = sorted(glob.glob(os.path.join(data, '*.csv')))
+    df = pd.concat([pd.read_csv(f) for f in files], ignore_index=True)
+    return pd.concat([df] * repeat, ignore_index=True)
+
+
+def best_of(func, df, number):
+    return min(timeit.repeat(lambda: func(df), number=1, repeat=number))
+
+
+def main():
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(
+        description='Time the ResponseHour computation.')
+    parser.add_argument('--data', default=os.path.join(here, 'dash-shope', 'data'))
+    parser.add_argument('--repeat', type=int, default=24)
+    parser.add_argument('--number', type=int, default=3)
+    args = parser.parse_args()
+
+    df = load(args.data, args.repeat)
+    fast = vectorized(df)
+    slow = rowwise(df)
+    assert ((fast - slow.astype(float)).abs().fillna(0) < 1e-9).all()
+
+    t_slow = best_of(rowwise, df, args.number)
+    t_fast = best_of(vectorized, df, args.number)
+    t_joined = best_of(lambda d: transform.joined_months(d['Joined']), df, args.number)
+    print('rows          {:>12,}'.format(len(df)))
+    print('row-wise      {:>10.4f}s'.format(t_slow))
+    print('vectorized    {:>10.4f}s  ({:.0f}x faster)'.format(t_fast, t_slow / t_fast))
+    print('joined months {:>10.4f}s'.format(t_joined))
+
+
+if __name__ == '__main__':
+    main()
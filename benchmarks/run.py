@@ -0,0 +1,236 @@
+# Benchmark suite for the load, clean, train, predict, render, recommend
+# and similar listings stages
+#
+#   python -m benchmarks.run                       # 10k and 100k rows
+#   python -m benchmarks.run --sizes 10000 --save  # store a new baseline
+#   python -m benchmarks.run --sizes 1000000       # 1M rows, see below
+#
+# 1M rows is not run by default: a forest of 200 trees on it takes close to
+# an hour on one core and several GB of memory, and baseline.json only holds
+# the default sizes. Record a 1M baseline with --save on a machine that can
+# run it before comparing against one.
+#
+# Runs fully offline: synthetic data stands in for the scraped categories
+# and a local SQLite file stands in for HBase/Hive. Each stage reports its
+# wall time and peak traced memory, compared against baseline.json.
+import argparse
+import json
+import os
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / 'ShopRater'), str(ROOT / 'dash-shope'),
+                str(ROOT / 'Product-Recommender')]
+
+import aggregates  # noqa: E402
+import index  # noqa: E402
+import loader  # noqa: E402
+import batch  # noqa: E402
+import model_store  # noqa: E402
+import plots  # noqa: E402
+import queries  # noqa: E402
+import recommender  # noqa: E402
+import similar  # noqa: E402
+from benchmarks import startup, synthetic  # noqa: E402
+from shdata import ingest, schema, store, text, transform  # noqa: E402
+from shdata.stats import Stats  # noqa: E402
+
+BASELINE = pathlib.Path(__file__).resolve().parent / 'baseline.json'
+
+# Rows of synthetic data benchmarked by default, those in baseline.json
+SIZES = [10000, 100000]
+
+# Lowest recall@10 of the similar listings index accepted
+RECALL = 0.9
+
+
+# Wall time in seconds and peak traced memory in MB of one call
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, {'seconds': round(seconds, 4), 'peak_mb': round(peak / 1024 ** 2, 1)}
+
+
+# Share of the 10 labels most similar to each query by an exact scan that the
+# similar listings index returns, with ties on the rounded similarity counted
+def similar_recall(found, labels, answers):
+    X = similar.vectors(labels, found.idf)
+    hits = 0
+    for label, result in answers:
+        exact = (X @ similar.vectors([label], found.idf).T).toarray().ravel()
+        tenth = np.sort(exact)[-10].round(3)
+        hits += min(10, int((result['Similarity'] >= tenth).sum()))
+    return hits / (10 * len(answers))
+
+
+def run_size(rows, trees, workdir):
+    results = {}
+    raw = synthetic.generate(rows)
+    conn = synthetic.to_sqlite(raw, workdir / ('items-%d.db' % rows))
+
+    # load: HBase/Hive stand-in read in chunks, then the Parquet snapshot
+    def load_sql():
+        chunks = ingest.iter_query('SELECT * FROM Shopee_Items', conn)
+        return ingest.write_snapshot('items-%d' % rows, chunks, workdir)
+    _, results['load_sql_to_snapshot'] = measure(load_sql)
+
+    def load_snapshot():
+        return schema.apply_schema(ingest.read_clean('items-%d' % rows, workdir), keep=['Label'])
+    df, results['load_snapshot'] = measure(load_snapshot)
+    _, results['load_snapshot_columns'] = measure(lambda: schema.apply_schema(ingest.read_clean(
+        'items-%d' % rows, workdir, columns=loader.section_columns('predict')), keep=['Label']))
+    conn.close()
+
+    # load all: one snapshot per category, read concurrently into one frame.
+    # The loader prefers store batches, so it is pointed at an empty store.
+    loader.SNAPSHOT_DIR = workdir / ('categories-%d' % rows)
+    loader.STORE_DIR = workdir / ('categories-store-%d' % rows)
+    for cat, part in raw.groupby('Category'):
+        ingest.write_snapshot(cat, [part.reset_index(drop=True)], loader.SNAPSHOT_DIR)
+    loader.invalidate()
+    _, results['load_all_categories'] = measure(lambda: loader.load_many(loader.df_cat))
+
+    # store: append a scraper CSV of one category, then read its latest batch
+    csv = workdir / ('Automotive-%d.csv' % rows)
+    raw.drop(columns='Category').to_csv(csv, index=False)
+    _, results['store_append_csv'] = measure(lambda: store.append(csv, workdir / ('store-%d' % rows), 'Automotive'))
+    _, results['store_read_latest'] = measure(
+        lambda: store.latest(workdir / ('store-%d' % rows)).read_clean('Automotive'))
+
+    # clean: Unicode label cleaning and tokenizing as run at ingest
+    labels = synthetic.labels(rows)
+    _, results['clean_labels'] = measure(lambda: text.clean_labels(labels))
+
+    # train / predict: the rating model of sh_app.py
+    (model, score), results['train'] = measure(
+        lambda: model_store.train(df, {'n_estimators': trees, 'n_jobs': -1}, engine='forest'))
+    _, results['predict_batch'] = measure(lambda: batch.predict_stars(model, df))
+    (boosted, _), results['train_boosting'] = measure(lambda: model_store.train(df, engine='boosting'))
+    _, results['predict_batch_boosting'] = measure(lambda: batch.predict_stars(boosted, df))
+
+    # correlation heatmap: full frame against the mergeable statistics
+    _, results['correlation_pandas'] = measure(
+        lambda: df.select_dtypes('number').corr())
+    _, results['correlation_stats'] = measure(lambda: Stats.compute(df).corr())
+
+    # render: ShopRater plot data and the Dash comparison chart callback
+    _, results['render_plots'] = measure(
+        lambda: (plots.histogram_data(df), plots.density_data(df), plots.box_data(df)))
+
+    def dash_chart():
+        df['ResponseHour'] = transform.response_hours(df['ResponseRate'], df['ResponseTime'])
+        sellers = aggregates.SellerAggregates(df)
+        return aggregates.chart_values(sellers.mean('Followers'), 'top', 0)
+    _, results['render_dash_chart'] = measure(dash_chart)
+
+    # the same chart grouped by seller in SQL, on the stand-in of the Hive table
+    queries.SQLITE_PATH, queries.TABLE = str(workdir / ('items-%d.db' % rows)), 'Shopee_Items'
+    _, results['render_dash_query'] = measure(lambda: queries.chart_values('Followers', 'top', 0))
+
+    # recommend: co-occurrence counts and top-k of the Product-Recommender
+    bought = recommender.purchases(synthetic.purchases(rows))
+    rec, results['cooccurrence'] = measure(lambda: recommender.Recommender(bought))
+    _, results['recommend'] = measure(rec.recommend)
+
+    # serve: publish the index and time 10k customer lookups against it
+    version = index.publish(rec, workdir / ('index-%d' % rows))
+    served = index.Index(workdir / ('index-%d' % rows) / version)
+    customers = np.resize(served.customers, 10000)
+    _, results['serve_10k_lookups'] = measure(lambda: [served.recommend(c) for c in customers])
+
+    # similar: label index build, then 100 queries with labels of the data
+    _, results['similar_build'] = measure(lambda: similar.build(df, workdir / ('similar-%d' % rows)))
+    found = similar.SimilarIndex(workdir / ('similar-%d' % rows))
+    labels = df['Label'].sample(100, replace=True, random_state=0)
+    _, results['similar_100_queries'] = measure(lambda: [found.query(label) for label in labels])
+
+    # similar recall: the labels of synthetic.labels share many trigrams
+    # without being duplicates, unlike those of the data above
+    items = pd.DataFrame({'Label': synthetic.labels(rows)}).assign(
+        Category='', Stars=0.0, Sold=0, PriceMin=0.0, PriceMax=0.0)
+    similar.build(items, workdir / ('similar-labels-%d' % rows))
+    found = similar.SimilarIndex(workdir / ('similar-labels-%d' % rows))
+    labels = items['Label'].sample(100, replace=True, random_state=0)
+    answers, results['similar_labels_queries'] = measure(
+        lambda: [(label, found.query(label)) for label in labels])
+    results['similar_labels_queries']['recall'] = round(
+        similar_recall(found, items['Label'], answers), 3)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    slower = []
+    for rows, stages in results.items():
+        base = baseline.get('results', {}).get(rows, {})
+        for stage, res in stages.items():
+            line = '{:>9} {:<24} {:>9.4f}s {:>9.1f}MB'.format(rows, stage, res['seconds'], res['peak_mb'])
+            if 'recall' in res:
+                line += '  recall@10 {:.3f}'.format(res['recall'])
+            if stage in base and base[stage]['seconds'] > 0:
+                ratio = res['seconds'] / base[stage]['seconds']
+                line += '  {:5.2f}x baseline'.format(ratio)
+                if ratio > tolerance:
+                    slower.append((rows, stage, ratio))
+            print(line)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the data, model and chart stages.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--trees', type=int, default=model_store.PARAMS['n_estimators'],
+                        help='trees in the benchmarked forest')
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='fail when a stage is this many times slower than the baseline')
+    args = parser.parse_args()
+
+    config = {'trees': args.trees, 'python': platform.python_version(),
+              'machine': platform.machine(), 'cpus': os.cpu_count()}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.sizes:
+            results[str(rows)] = run_size(rows, args.trees, pathlib.Path(tmp))
+
+    # Cold start: import time of the ShopRater server in a fresh interpreter
+    seconds, _ = startup.measure()
+    results['startup'] = {'import_server': {'seconds': round(seconds, 4), 'peak_mb': 0.0}}
+
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    if baseline.get('config', {}).get('trees') not in (None, args.trees):
+        print('Baseline was recorded with {} trees, timings are not comparable'.format(
+            baseline['config']['trees']))
+        baseline = {}
+    slower = compare(results, baseline, args.tolerance)
+    if seconds > startup.BUDGET:
+        slower.append(('startup', 'import_server', seconds / startup.BUDGET))
+    missed = [(rows, stage, res['recall']) for rows, stages in results.items()
+              for stage, res in stages.items() if res.get('recall', 1) < RECALL]
+    for rows, stage, recall in missed:
+        print('Recall@10 below {}: {} rows {} ({:.3f})'.format(RECALL, rows, stage, recall))
+
+    if args.save:
+        merged = dict(baseline.get('results', {}), **results)
+        BASELINE.write_text(json.dumps({'config': config, 'results': merged}, indent=2) + '\n')
+        print('Baseline saved to', BASELINE)
+    elif slower:
+        for rows, stage, ratio in slower:
+            print('Slower than baseline: {} rows {} ({:.2f}x)'.format(rows, stage, ratio))
+        return 1
+    return 1 if missed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,67 @@
+# Import time of the ShopRater server modules
+#
+#   python -m benchmarks.startup               # report against the budget
+#   python -m benchmarks.startup --top 20
+#
+# Runs a fresh interpreter with -X importtime, so nothing imported by the
+# benchmark itself is counted, and sums the cumulative time of the modules
+# imported directly by the server.
+import argparse
+import os
+import pathlib
+import subprocess
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+# Modules sh_app.py loads before the first page is drawn
+MODULES = ['pandas', 'altair', 'batch', 'model_store', 'plots', 'loader', 'warmup']
+
+# Seconds the imports above may take in total
+BUDGET = 2.0
+
+
+# Self and cumulative microseconds of every imported module
+def importtime(modules):
+    code = ''.join('import {}\n'.format(m) for m in modules)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [str(ROOT), str(ROOT / 'ShopRater'), os.environ.get('PYTHONPATH', '')]))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          cwd=str(ROOT / 'ShopRater'), env=env,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times.append((name.strip(), int(own), int(cumulative), depth))
+    return times
+
+
+# Total seconds of the top level imports and the slowest modules by own time
+def measure(modules=MODULES):
+    times = importtime(modules)
+    total = sum(c for _, _, c, depth in times if depth == 0) / 1e6
+    slowest = sorted(times, key=lambda t: -t[1])
+    return total, slowest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import time of the ShopRater server.')
+    parser.add_argument('--top', type=int, default=10, help='slowest modules to list')
+    parser.add_argument('--budget', type=float, default=BUDGET, help='seconds allowed in total')
+    args = parser.parse_args()
+
+    total, slowest = measure()
+    for name, own, cumulative, _ in slowest[:args.top]:
+        print('{:<40} {:>9.3f}s {:>9.3f}s cumulative'.format(name, own / 1e6, cumulative / 1e6))
+    print('{:<40} {:>9.3f}s (budget {:.1f}s)'.format('total', total, args.budget))
+    return 1 if total > args.budget else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,104 @@
+# Synthetic Shopee item data with the same columns as Automotive.csv
+#
+# Each seller gets fixed shop attributes shared by all of its items, so
+# seller level aggregation behaves like on the scraped data.
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from shdata.schema import CATEGORIES
+
+WORDS = ["sticker", "meter", "cover", "motor", "window", "coating", "diamond", "helmet", "lamp", "led",
+         "seat", "mirror", "holder", "phone", "cable", "charger", "baru", "murah", "original", "ready stock",
+         "kereta", "motosikal", "oil", "filter", "brake", "pad", "tyre", "rim", "horn", "spray"]
+
+
+def generate(rows, seed=0):
+    rng = np.random.RandomState(seed)
+    sellers = max(rows // 200, 1)
+
+    # Shop attributes, one entry per seller
+    shop = pd.DataFrame({
+        'Seller': ['seller%05d' % i for i in range(sellers)],
+        'SellerRatings': rng.lognormal(5, 1.5, sellers).astype(np.int64),
+        'Products': rng.lognormal(4.5, 1.5, sellers).astype(np.int64) + 1,
+        'ResponseRate': rng.uniform(0.15, 1, sellers).round(2),
+        'ResponseTime': rng.choice(['hours', 'days', 'minutes'], sellers, p=[0.6, 0.34, 0.06]),
+        'Joined': ['%d %s ' % (n, u) for n, u in zip(
+            rng.randint(1, 60, sellers), rng.choice(['months', 'years', 'days'], sellers, p=[0.8, 0.15, 0.05]))],
+        'Followers': rng.lognormal(4.5, 1.8, sellers).astype(np.int64),
+    })
+    owner = rng.randint(0, sellers, rows)
+
+    rated = rng.rand(rows) < 0.45
+    ratings = np.where(rated, rng.lognormal(2, 1.5, rows), 0).astype(np.int64)
+    price = rng.lognormal(3.5, 1.2, rows).round(2)
+    words = np.array(WORDS)[rng.randint(0, len(WORDS), (rows, 4))]
+
+    df = pd.DataFrame({
+        'Category': rng.choice(CATEGORIES, rows),
+        'Label': [' '.join(w).upper() for w in words],
+        'Stars': np.where(rated, rng.uniform(3.5, 5, rows), 0).round(1),
+        'Ratings': ratings,
+        'Sold': (ratings * rng.uniform(1, 2, rows)).astype(np.int64),
+        'PriceMin': price,
+        'PriceMax': (price * rng.choice([1, 1, 1.5, 3], rows)).round(2),
+        'Stock': rng.randint(0, 2000, rows),
+    })
+    df = pd.concat([df, shop.iloc[owner].reset_index(drop=True)], axis=1)
+    df['URL'] = ['https://shopee.com.my/item-i.%d.%d' % (o, i) for i, o in enumerate(owner)]
+    return df
+
+
+# Local SQLite stand-in for the Shopee_Items HBase table and the Hive table
+def to_sqlite(df, path):
+    conn = sqlite3.connect(str(path))
+    df.to_sql('Shopee_Items', conn, index=False, if_exists='replace', chunksize=50000)
+    conn.execute('CREATE INDEX IF NOT EXISTS category ON Shopee_Items (Category)')
+    conn.commit()
+    return conn
+
+
+# Synthetic purchases with the columns of Ecommerce_data.csv. Customers buy
+# mostly within a few product groups, so items co-occur as in real baskets.
+def purchases(rows, customers=None, products=None, seed=0):
+    rng = np.random.RandomState(seed)
+    customers = customers or max(rows // 20, 1)
+    products = products or max(rows // 100, 10)
+    groups = max(products // 20, 1)
+
+    cust = rng.randint(0, customers, rows)
+    group = (cust * 7 + rng.randint(0, 3, rows)) % groups
+    product = (group * 20 + rng.zipf(1.5, rows) % 20) % products
+    # A few products are listed under two descriptions, as in the real data
+    variant = np.where(product % 50 == 0, rng.randint(0, 2, rows), 0)
+    when = pd.Timestamp('2010-12-01') + pd.to_timedelta(rng.randint(0, 365 * 24 * 60, rows), unit='min')
+
+    df = pd.DataFrame({
+        'invoice_no': (500000 + rng.randint(0, rows // 5 + 1, rows)).astype(str),
+        'product_id': ['P%05d' % p for p in product],
+        'description': [('%s %s%s' % (WORDS[p % len(WORDS)], WORDS[p // len(WORDS) % len(WORDS)],
+                                      ' v2' if v else '')).upper() for p, v in zip(product, variant)],
+        'quantity': rng.randint(1, 12, rows),
+        'purchased_at': when.strftime('%d/%m/%Y %H:%M'),
+        'unit_price': rng.randint(1, 50, rows),
+        'customer_id': (12000 + cust).astype(float),
+        'country': 'Malaysia',
+    })
+    df.loc[rng.rand(rows) < 0.05, 'customer_id'] = np.nan
+    return df
+
+
+# Labels as scraped: mixed case Malay and English words with Chinese,
+# emoji, punctuation and model numbers, mostly distinct from each other
+EXTRA = ["头盔", "汽车", "防水", "🔥", "🏍️", "✨", "100%", "[READY STOCK]", "(Free Gift)", "café", "ＬＥＤ", "-"]
+
+
+def labels(rows, seed=0):
+    rng = np.random.RandomState(seed)
+    vocab = np.array(WORDS + [w.upper() for w in WORDS] + EXTRA)
+    words = vocab[rng.randint(0, len(vocab), (rows, 6))]
+    models = rng.randint(0, 100000, rows)
+    return pd.Series(['%s %s %s #%05d %s %s %s' % (a, b, c, m, d, e, f)
+                      for (a, b, c, d, e, f), m in zip(words.tolist(), models)])
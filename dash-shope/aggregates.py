@@ -0,0 +1,93 @@
+# Seller level aggregates shared by the KPI cards and the comparison chart
+#
+# The item rows are grouped by seller once, keeping the sum and count of each
+# metric. Means are derived from those, and new rows are folded in by adding
+# their own sums and counts, so the item rows never have to be grouped again.
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+METRICS = ["SellerRatings", "Products", "Followers", "ResponseRate", "ResponseHour"]
+
+# Ways of showing the sellers in the comparison chart
+VIEWS = {"top": "Top sellers", "bottom": "Bottom sellers", "histogram": "Distribution"}
+
+# Most bars sent to the browser for one chart
+TOP_N = 25
+BINS = 20
+
+# Decimals the seller means are binned at, so means summed in a different
+# order, e.g. by Hive, fall in the same bins
+DIGITS = 9
+
+
+class SellerAggregates:
+
+    def __init__(self, df=None, metrics=None):
+        self.metrics = list(metrics or METRICS)
+        self.table = pd.DataFrame()
+        self.version = None
+        if df is not None:
+            self.update(df)
+
+    # Sum and count of each metric per seller in a single groupby pass
+    def summarize(self, df):
+        metrics = [m for m in self.metrics if m in df.columns]
+        return df.groupby("Seller", observed=True, sort=False)[metrics].agg(["sum", "count"])
+
+    # Fold new item rows into the table
+    def update(self, df):
+        part = self.summarize(df)
+        if self.table.empty:
+            self.table = part
+        else:
+            self.table = self.table.add(part, fill_value=0)
+        # Derived from the contents, so every worker agrees on it
+        rows = pd.util.hash_pandas_object(self.table)
+        self.version = hashlib.sha1(rows.values.tobytes()).hexdigest()[:16]
+        return self
+
+    @property
+    def sellers(self):
+        return self.table.index
+
+    # Item count per seller
+    def count(self, metric):
+        return self.table[(metric, "count")]
+
+    def sum(self, metric):
+        return self.table[(metric, "sum")]
+
+    # Mean of a metric per seller
+    def mean(self, metric):
+        return self.sum(metric) / self.count(metric).where(lambda c: c > 0)
+
+    # Average over sellers of the per seller mean, as shown on the KPI cards
+    def overall(self, metric):
+        return self.mean(metric).mean()
+
+
+# One page of sellers ranked by a metric. Only the first (page + 1) * n
+# values are sorted, and pages past the end wrap around to the first.
+def ranked(values, n=TOP_N, page=0, ascending=False):
+    values = values.dropna()
+    if n * page >= len(values):
+        page = 0
+    stop = n * (page + 1)
+    part = values.nsmallest(stop) if ascending else values.nlargest(stop)
+    return part.iloc[n * page:]
+
+
+# Number of sellers falling in each value range of a metric
+def histogram(values, bins=BINS):
+    counts, edges = np.histogram(values.dropna().round(DIGITS), bins=bins)
+    labels = ["{:.4g} - {:.4g}".format(lo, hi) for lo, hi in zip(edges[:-1], edges[1:])]
+    return pd.Series(counts, index=labels)
+
+
+# The bars to draw for a metric, bounded in size whatever the number of sellers
+def chart_values(values, view="top", page=0, n=TOP_N):
+    if view == "histogram":
+        return histogram(values)
+    return ranked(values, n, page, ascending=view == "bottom")
@@ -1,5 +1,6 @@
 import pathlib
 import os
+import sys
 
 import pandas as pd
 import numpy as np
@@ -11,6 +12,14 @@ import plotly.graph_objs as go
 from dash.dependencies import Input, Output, State
 import dash_bootstrap_components as dbc
 
+import memo
+from aggregates import VIEWS, SellerAggregates, chart_values
+
+# The shdata package shared with ShopRater lives in the repository root
+APP_PATH = pathlib.Path(__file__).resolve().parent
+sys.path.append(str(APP_PATH.parent))
+from shdata import schema, store, timing, transform
+
 colors = {
     'background': '#CD5C5C',
     'text': '#FDFEFE'
@@ -27,6 +36,9 @@ app = dash.Dash(
 
 
 server = app.server
+memo.register(server)
+# Time every request and callback, served on /metrics
+timing.instrument(server)
 app.config["suppress_callback_exceptions"] = True
 
 
@@ -47,15 +59,24 @@ app.config["suppress_callback_exceptions"] = True
 #        'Seller', 'SellerRatings', 'Products', 'ResponseRate', 'ResponseTime',
 #        'Joined', 'Followers', 'URL'])
 
-df=pd.read_csv("/Users/liuhongyang/Desktop/ShData-master/dash-shope/data/Automotive.csv")
+# The latest scrape of the category appended by python -m shdata.store,
+# or the CSV kept with the app until one has been
+latest = store.latest()
+if latest is not None and "Automotive" in latest.parts:
+    df = latest.read_clean("Automotive")
+else:
+    df = pd.read_csv(APP_PATH / "data" / "Automotive.csv")
 
 df.head()
 
 df=df.dropna()
 df=df.drop_duplicates(keep='first')
+
+# Hold the data in the compact schema types, without the Label/URL text
+df = schema.apply_schema(df)
 df1=df
 # APP_PATH = str(pathlib.Path(__file__).parent.resolve())
-AttributeName=["SellerRatings","Products","Followers","ResponseRate"]
+AttributeNames=["SellerRatings","Products","Followers","ResponseRate"]
 
 
 
@@ -63,18 +84,12 @@ AttributeName=["SellerRatings","Products","Followers","ResponseRate"]
 # AttributeName=["SellerRatings","Products","Followers","ResponseRate"]
 # df = pd.read_csv(os.path.join(APP_PATH, os.path.join("data", "Automotive.csv")))
 
-def transform_time(response_rate, response_time):
-    if response_time == 'hours':
-        return response_rate
-    elif response_time == 'days':
-        a = response_rate * 24
-        return a
-    elif response_time == 'minutes':
-        a= response_rate/60
-        return a
+# Response rate scaled to hours, converted per distinct unit instead of per row
+df1['ResponseHour'] = transform.response_hours(df1['ResponseRate'], df1['ResponseTime'])
 
-df1['ResponseHour'] = df1.apply(lambda x: transform_time(x['ResponseRate'], x['ResponseTime']), axis=1)
-Average_Res_Hour = df1.groupby('Seller')['ResponseHour'].mean().mean()
+# Seller level sums and counts, computed once for the cards and the chart
+sellers = SellerAggregates(df1)
+Average_Res_Hour = sellers.overall('ResponseHour')
 
 
 
@@ -128,7 +143,7 @@ app.layout = html.Div(
                                     id="operator-select",
                                     options=[
                                         {"label": i, "value": i}
-                                        for i in AttributeName
+                                        for i in AttributeNames
                                     ],
 
                                     style={
@@ -141,6 +156,22 @@ app.layout = html.Div(
                                         ""
                                     ],
                                 ),
+
+                                dcc.Dropdown(
+                                    id="view-select",
+                                    options=[
+                                        {"label": label, "value": value}
+                                        for value, label in VIEWS.items()
+                                    ],
+                                    style={
+                                                'textAlign': 'left',
+                                                'color': colors['text']
+                                            },
+                                    clearable=False,
+                                    value="top",
+                                ),
+
+                                html.Button("Show more", id="show-more", n_clicks=0),
                             ],
                         )
 
@@ -197,7 +228,7 @@ app.layout = html.Div(
                               # Average of SellerRatings
                               dbc.Col(children=[html.H4("Seller's Ratings",
                                                         style={'padding-top': '0px', 'backgroundColor': '#FFFFFF'}),
-                                                html.Div(round(df1.groupby('Seller')['SellerRatings'].mean().mean()),
+                                                html.Div(round(sellers.overall('SellerRatings')),
                                                          style={'font-size': '34px', 'font-weight': '700',
                                                                 'color': '#FFFFFF'}, )],
                                       width={"size": 1}),
@@ -205,14 +236,14 @@ app.layout = html.Div(
                               # Average of products
                               dbc.Col(children=[html.H4("Seller's Products",
                                                         style={'padding-top': '0px', 'backgroundColor': '#FFFFFF'}),
-                                                html.Div(round(df1.groupby('Seller')['Products'].mean().mean()),
+                                                html.Div(round(sellers.overall('Products')),
                                                          style={'font-size': '34px', 'font-weight': '700',
                                                                 'color': '#FFFFFF'}, )],
                                       width={"size": 1}),
 
                               # average of the followers
                               dbc.Col(children=[html.H4('# of Followers', style={'backgroundColor': '#FFFFFF'}),
-                                                html.Div(round(df1.groupby('Seller')['Followers'].mean().mean()),
+                                                html.Div(round(sellers.overall('Followers')),
                                                          style={'font-size': '34px', 'font-weight': '700',
                                                                 'color': '#FFFFFF'})],
                                       width={"size": 1}),
@@ -243,22 +274,21 @@ app.layout = html.Div(
 
 
 @app.callback(Output('ternary-map','figure'),
-              [ Input('operator-select','value') ])
-def toprightlineChart(AttributeName):
+              [ Input('operator-select','value'),
+                Input('view-select','value'),
+                Input('show-more','n_clicks') ])
+@memo.memoize(version=lambda: sellers.version)
+def toprightlineChart(AttributeName, View, Page):
 
     data=[]
 
-    x=df["Seller"]
-    if AttributeName == "SellerRatings":
-        y = df["SellerRatings"]
-    elif AttributeName == "Products":
-        y = df["Products"]
-    elif AttributeName == "Followers":
-        y = df["Followers"]
-    elif AttributeName == "ResponseRate":
-        # ResponseRate
-        y = df["ResponseRate"]
+    # One bar per seller, read from the precomputed seller table and cut
+    # down to a page of top/bottom sellers or a histogram before sending
+    if AttributeName in AttributeNames:
+        y = chart_values(sellers.mean(AttributeName), View, Page or 0)
+        x = y.index
     else:
+        x=[]
         y=[]
 
 
@@ -1,7 +1,6 @@
 import pathlib
 import os
 
-import pandas as pd
 import numpy as np
 
 import dash
@@ -10,6 +9,12 @@ import dash_html_components as html
 import plotly.graph_objs as go
 from dash.dependencies import Input, Output, State
 
+import memo
+import queries
+from aggregates import VIEWS
+# queries puts the repository root holding shdata on the path
+from shdata import timing
+
 colors = {
     'background': '#CD5C5C',
     'text': '#FDFEFE'
@@ -26,38 +31,23 @@ app = dash.Dash(
 
 
 server = app.server
+memo.register(server)
 app.config["suppress_callback_exceptions"] = True
 
 
 
-Load data
-
-from pyhive import hive
-conn = hive.connect(host='10.242.134.39', port=10000, username='root', auth='NONE')
-cursor = conn.cursor()
-cursor.execute("select * from shopedata limit 2000")
-Shopedata = []
-for result in cursor.fetchall():
-    data = []
-    for i in result:
-        data.append(i)
-    Shopedata.append(data)
-cursor.close()
-
-
-
-df=pd.DataFrame(data=Shopedata,columns=['Label', 'Stars', 'Ratings', 'Sold', 'PriceMin', 'PriceMax', 'Stock',
-       'Seller', 'SellerRatings', 'Products', 'ResponseRate', 'ResponseTime',
-       'Joined', 'Followers', 'URL'])
+# Data
+# Seller metrics are aggregated over the whole Hive table by the queries
+# module (or its local SQLite stand-in), so only the bars drawn are fetched
 
+# Time every request and callback, served on /metrics
+timing.instrument(server)
 
+AttributeNames=["SellerRatings","Products","Followers","ResponseRate"]
 
-df=df.dropna()
-
-df=df.drop_duplicates(keep='first')
-
-APP_PATH = str(pathlib.Path(__file__).parent.resolve())
-AttributeName=["SellerRatings","Products","Followers","ResponseRate"]
+# KPI cards, each the average over sellers of the per seller mean
+KPIS={"SellerRatings":"Seller's Ratings","Products":"Seller's Products",
+      "Followers":"# of Followers","ResponseHour":"Response Hour"}
 
 
 
@@ -78,6 +68,23 @@ def build_graph_title(title):
     return html.P(className="graph-title", children=title)
 
 
+def build_kpi(title, value):
+    return html.Div(
+        className="two columns",
+        children=[
+            html.H4(title, style={'backgroundColor': '#FFFFFF'}),
+            html.Div(value, style={'font-size': '34px', 'font-weight': '700', 'color': colors['text']}),
+        ],
+    )
+
+
+def build_table(df):
+    return html.Table(
+        [html.Tr([html.Th(c) for c in df.columns])] +
+        [html.Tr([html.Td(v) for v in row]) for row in df.itertuples(index=False)]
+    )
+
+
 
 
 app.layout = html.Div(
@@ -113,7 +120,7 @@ app.layout = html.Div(
                                     id="operator-select",
                                     options=[
                                         {"label": i, "value": i}
-                                        for i in AttributeName
+                                        for i in AttributeNames
                                     ],
 
                                     style={
@@ -126,6 +133,22 @@ app.layout = html.Div(
                                         ""
                                     ],
                                 ),
+
+                                dcc.Dropdown(
+                                    id="view-select",
+                                    options=[
+                                        {"label": label, "value": value}
+                                        for value, label in VIEWS.items()
+                                    ],
+                                    style={
+                                                'textAlign': 'left',
+                                                'color': colors['text']
+                                            },
+                                    clearable=False,
+                                    value="top",
+                                ),
+
+                                html.Button("Show more", id="show-more", n_clicks=0),
                             ],
                         )
 
@@ -176,33 +199,46 @@ app.layout = html.Div(
 
                     ],
                 ),
+
+            #---
+                # Averages over all sellers, as in app-Terry.py
+                html.Div(className="row", id="kpi-row"),
             ],
-        )
+        ),
 
         #---- bottom ---
 
+        # A random sample of the items, refreshed with the query cache
+        html.Div(
+            id="bottom-row",
+            children=[
+                build_graph_title("Sample of items"),
+                html.Div(id="preview"),
+            ],
+        ),
+        dcc.Location(id="url"),
+
     ]
 )
 
 
 
 @app.callback(Output('ternary-map','figure'),
-              [ Input('operator-select','value') ])
-def toprightlineChart(AttributeName):
+              [ Input('operator-select','value'),
+                Input('view-select','value'),
+                Input('show-more','n_clicks') ])
+@memo.memoize(version=queries.version)
+def toprightlineChart(AttributeName, View, Page):
 
     data=[]
 
-    x=df["Seller"]
-    if AttributeName == "SellerRatings":
-        y = df["SellerRatings"]
-    elif AttributeName == "Products":
-        y = df["Products"]
-    elif AttributeName == "Followers":
-        y = df["Followers"]
-    elif AttributeName == "ResponseRate":
-        # ResponseRate
-        y = df["ResponseRate"]
+    # One bar per seller, grouped and cut down to a page of top/bottom
+    # sellers or a histogram by the query before sending
+    if AttributeName in AttributeNames:
+        y = queries.chart_values(AttributeName, View, Page or 0)
+        x = y.index
     else:
+        x=[]
         y=[]
 
 
@@ -231,5 +267,23 @@ def toprightlineChart(AttributeName):
 
 
 
+# Filled on page load from the seller aggregates of the whole table
+@app.callback(Output('kpi-row','children'),
+              [ Input('url','pathname') ])
+def kpiCards(_):
+    values = queries.overall(list(KPIS))
+    cards = [build_kpi("Sellers", int(values["Sellers"])),
+             build_kpi("Items", int(values["Items"]))]
+    for name, title in KPIS.items():
+        cards.append(build_kpi(title, round(values[name], 2)))
+    return cards
+
+
+@app.callback(Output('preview','children'),
+              [ Input('url','pathname') ])
+def previewTable(_):
+    return build_table(queries.preview())
+
+
 if __name__ == "__main__":
     app.run_server(debug=True)
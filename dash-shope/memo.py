@@ -0,0 +1,147 @@
+# Memoization of Dash callbacks
+#
+# Callback results are keyed by the callback name, its input values and the
+# version of the data they were computed from. The store is chosen with the
+# DASH_CACHE environment variable:
+#
+#   memory (default)         in-process LRU, one per gunicorn worker
+#   sqlite:///path/cache.db  file shared by all workers on the machine
+#   redis://localhost:6379/0 Redis server shared by all workers
+import functools
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import flask
+
+
+class LRUStore:
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.items:
+                return None
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class SQLiteStore:
+    # Pickled results in a local SQLite file, trimmed to the newest maxsize rows
+
+    def __init__(self, path, maxsize=4096):
+        self.path = path
+        self.maxsize = maxsize
+        self.local = threading.local()
+        with self.connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS memo "
+                         "(key TEXT PRIMARY KEY, value BLOB, used INTEGER)")
+
+    def connect(self):
+        if not hasattr(self.local, "conn"):
+            self.local.conn = sqlite3.connect(self.path, timeout=10)
+        return self.local.conn
+
+    def get(self, key):
+        conn = self.connect()
+        row = conn.execute("SELECT value FROM memo WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute("UPDATE memo SET used = strftime('%s', 'now') WHERE key = ?", (key,))
+        return pickle.loads(row[0])
+
+    def set(self, key, value):
+        with self.connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO memo VALUES (?, ?, strftime('%s', 'now'))",
+                         (key, sqlite3.Binary(pickle.dumps(value))))
+            conn.execute("DELETE FROM memo WHERE key NOT IN "
+                         "(SELECT key FROM memo ORDER BY used DESC LIMIT ?)", (self.maxsize,))
+
+    def __len__(self):
+        return self.connect().execute("SELECT COUNT(*) FROM memo").fetchone()[0]
+
+
+class RedisStore:
+    # Pickled results in Redis, expiring after ttl seconds
+
+    def __init__(self, url, ttl=3600):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get("memo:" + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value):
+        self.client.set("memo:" + key, pickle.dumps(value), ex=self.ttl)
+
+    def __len__(self):
+        return len(self.client.keys("memo:*"))
+
+
+def open_store(spec=None):
+    spec = spec or os.environ.get("DASH_CACHE", "memory")
+    if spec.startswith("sqlite:///"):
+        return SQLiteStore(spec[len("sqlite:///"):])
+    if spec.startswith("redis://"):
+        return RedisStore(spec)
+    return LRUStore()
+
+
+store = open_store()
+
+# Hit and miss counts per callback in this worker
+stats = {}
+
+
+# Cache the results of a callback. version() returns the version of the data
+# the callback reads, so results are recomputed once the data changes.
+def memoize(version=lambda: 0):
+    def decorator(func):
+        counts = stats.setdefault(func.__name__, {"hits": 0, "misses": 0})
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = json.dumps([func.__module__, func.__name__, version(), args],
+                             sort_keys=True, default=str)
+            key = hashlib.sha1(key.encode()).hexdigest()
+            result = store.get(key)
+            if result is not None:
+                counts["hits"] += 1
+                return result
+            counts["misses"] += 1
+            result = func(*args)
+            store.set(key, result)
+            return result
+        return wrapper
+    return decorator
+
+
+# Add a /cache-stats route reporting the hit and miss counts as JSON
+def register(server):
+    @server.route("/cache-stats")
+    def cache_stats():
+        return flask.jsonify({"pid": os.getpid(),
+                              "store": type(store).__name__,
+                              "entries": len(store),
+                              "callbacks": stats})
@@ -0,0 +1,204 @@
+# Seller metrics aggregated in Hive instead of pandas
+#
+# The dashboard only shows per seller means of a few metrics, so rather than
+# pulling item rows over the wire the queries here group by seller in Hive
+# and return at most a page of rows: the top or bottom sellers by a metric,
+# a histogram of the seller means, the average over sellers shown on the
+# KPI cards, and a random preview of items. Results are cached per query in
+# the memo store (DASH_CACHE) and refreshed every QUERY_TTL seconds.
+#
+# The queries run on the Hive server at HIVE_HOST, or on a local SQLite file
+# holding the table when SHOPE_SQLITE names one, e.g. for tests and the
+# benchmarks.
+import os
+import pathlib
+import sqlite3
+import sys
+import time
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+import memo
+from aggregates import BINS, DIGITS, TOP_N
+
+# The shdata package shared with ShopRater lives in the repository root
+APP_PATH = pathlib.Path(__file__).parent.resolve()
+sys.path.append(str(APP_PATH.parent))
+
+from shdata import transform  # noqa: E402
+
+HIVE_HOST = os.environ.get("HIVE_HOST", "10.242.134.39")
+HIVE_PORT = int(os.environ.get("HIVE_PORT", 10000))
+HIVE_USER = os.environ.get("HIVE_USER", "root")
+SQLITE_PATH = os.environ.get("SHOPE_SQLITE")
+TABLE = os.environ.get("SHOPE_TABLE", "shopedata")
+QUERY_TTL = int(os.environ.get("SHOPE_QUERY_TTL", 600))
+
+# Random rows per preview, taken from one bucket in SAMPLE_BUCKETS
+PREVIEW_ROWS = 20
+SAMPLE_BUCKETS = 100
+
+# Preview queries, which differ between Hive and SQLite
+SAMPLE = {
+    "hive": "SELECT * FROM {table} TABLESAMPLE(BUCKET 1 OUT OF {buckets} ON rand()) s LIMIT {rows}",
+    "sqlite": "SELECT * FROM {table} ORDER BY RANDOM() LIMIT {rows}",
+}
+
+
+def dialect():
+    return "sqlite" if SQLITE_PATH else "hive"
+
+
+# Where the queries run, part of the key of their cached results
+def source():
+    return SQLITE_PATH or "hive://{}:{}".format(HIVE_HOST, HIVE_PORT)
+
+
+def connect():
+    if SQLITE_PATH:
+        return sqlite3.connect(SQLITE_PATH)
+    from pyhive import hive
+    return hive.connect(host=HIVE_HOST, port=HIVE_PORT, username=HIVE_USER, auth="NONE")
+
+
+def quote(name):
+    return "`" + name.replace("`", "``") + "`"
+
+
+# Response rate scaled to hours, as transform.response_hours does in pandas
+def response_hours():
+    units = " ".join("WHEN '{}' THEN {!r}".format(unit, float(hours))
+                     for unit, hours in transform.RESPONSE_HOURS.items())
+    return "{} * CASE LOWER(TRIM({})) {} END".format(quote("ResponseRate"), quote("ResponseTime"), units)
+
+
+# SQL expression of each metric over the item rows
+def metric(name):
+    if name == "ResponseHour":
+        return response_hours()
+    return quote(name)
+
+
+# One row per seller with the number of items and the mean of each metric
+# over the seller's items
+def seller_means(metrics, table=None):
+    means = ", ".join("AVG({}) AS {}".format(metric(m), quote(m)) for m in metrics)
+    return ("SELECT {seller}, COUNT(*) AS {items}, {means} FROM {table} WHERE {seller} IS NOT NULL "
+            "GROUP BY {seller}").format(seller=quote("Seller"), items=quote("Items"), means=means,
+                                        table=table or TABLE)
+
+
+# A page of sellers ranked by the mean of a metric, ties broken by name
+def ranked_sql(name, n, page, ascending=False, table=None):
+    order = "ASC" if ascending else "DESC"
+    return ("{means} HAVING AVG({expr}) IS NOT NULL ORDER BY {value} {order}, {seller} "
+            "LIMIT {offset}, {n}").format(
+        means=seller_means([name], table), expr=metric(name), value=quote(name),
+        order=order, seller=quote("Seller"), offset=n * page, n=n)
+
+
+# Average over sellers of the per seller means, as on the KPI cards, with
+# the number of sellers and items they cover
+def overall_sql(metrics, table=None):
+    averages = ", ".join("AVG({0}) AS {0}".format(quote(m)) for m in metrics)
+    return "SELECT COUNT(*) AS {}, SUM({}) AS {}, {} FROM ({}) s".format(
+        quote("Sellers"), quote("Items"), quote("Items"), averages, seller_means(metrics, table))
+
+
+# Seller means rounded as aggregates.histogram bins them
+def rounded(name):
+    return "ROUND({}, {})".format(quote(name), DIGITS)
+
+
+def range_sql(name, table=None):
+    return "SELECT MIN({0}) AS lo, MAX({0}) AS hi FROM ({1}) s".format(
+        rounded(name), seller_means([name], table))
+
+
+# Sellers per bin of equal width between lo and hi. As in np.histogram,
+# bins are closed at their lower edge and open at their upper one except
+# the last, which includes hi, and the rounded means are compared with the
+# bin edges, so sellers on an edge fall in the same bin as in
+# aggregates.histogram.
+def histogram_sql(name, lo, hi, bins, table=None):
+    value = rounded(name)
+    edges = np.linspace(lo, hi, bins + 1)
+    index = "CASE {} ELSE {} END".format(
+        " ".join("WHEN {} < {!r} THEN {}".format(value, float(edge), i)
+                 for i, edge in enumerate(edges[1:-1])), bins - 1)
+    return "SELECT {index} AS bin, COUNT(*) AS sellers FROM ({means}) s WHERE {v} IS NOT NULL GROUP BY {index}".format(
+        index=index, means=seller_means([name], table), v=value)
+
+
+def sample_sql(rows=PREVIEW_ROWS, buckets=SAMPLE_BUCKETS, table=None):
+    return SAMPLE[dialect()].format(table=table or TABLE, rows=rows, buckets=buckets)
+
+
+# Cached results change every QUERY_TTL seconds
+def version():
+    return int(time.time() // QUERY_TTL)
+
+
+# Run a query, returning its result as a DataFrame. Results are a page of
+# rows at most, and are kept as returned rather than in the item schema
+# types, as the means of integer columns are fractional.
+@memo.memoize(version=version)
+def run(where, sql):
+    with closing(connect()) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql)
+            # Hive returns names as table.column, keep the column part only
+            columns = [d[0].split(".")[-1] for d in cursor.description]
+            return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+        finally:
+            cursor.close()
+
+
+def fetch(sql):
+    return run(source(), sql)
+
+
+# One page of sellers ranked by a metric. Pages past the end wrap around to
+# the first, as in aggregates.ranked.
+def ranked(name, n=TOP_N, page=0, ascending=False):
+    rows = fetch(ranked_sql(name, n, page, ascending))
+    if rows.empty and page:
+        rows = fetch(ranked_sql(name, n, 0, ascending))
+    return rows.set_index("Seller")[name].astype(float)
+
+
+# Number of sellers falling in each value range of a metric
+def histogram(name, bins=BINS):
+    lo, hi = fetch(range_sql(name)).iloc[0].tolist()
+    if lo is None or pd.isna(lo):
+        return pd.Series([], dtype=np.int64)
+    if lo == hi:
+        # np.histogram widens an empty range the same way
+        lo, hi = lo - 0.5, hi + 0.5
+    rows = fetch(histogram_sql(name, lo, hi, bins))
+    counts = np.zeros(bins, dtype=np.int64)
+    counts[rows["bin"].to_numpy(dtype=np.int64)] = rows["sellers"].to_numpy(dtype=np.int64)
+    edges = np.linspace(lo, hi, bins + 1)
+    labels = ["{:.4g} - {:.4g}".format(a, b) for a, b in zip(edges[:-1], edges[1:])]
+    return pd.Series(counts, index=labels)
+
+
+# The bars to draw for a metric, as aggregates.chart_values draws them
+def chart_values(name, view="top", page=0, n=TOP_N):
+    if view == "histogram":
+        return histogram(name)
+    return ranked(name, n, page, ascending=view == "bottom")
+
+
+# Number of sellers and items, and the average over sellers of the per
+# seller mean of each metric
+def overall(metrics):
+    return fetch(overall_sql(metrics)).iloc[0].astype(float)
+
+
+# Random item rows of the table
+def preview(rows=PREVIEW_ROWS):
+    return fetch(sample_sql(rows))
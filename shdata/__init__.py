@@ -0,0 +1 @@
+# Data handling shared by the ShopRater and dash-shope web applications
@@ -0,0 +1,152 @@
+# Chunked ingestion of Shopee item data into columnar Parquet snapshots
+#
+# Query results are paged through in fixed size chunks and each chunk is
+# converted straight into typed columns, so memory use is bounded by the
+# chunk size rather than the size of the table. The snapshots written here
+# are what the web applications read instead of querying HBase/Hive, and
+# carry the cleaned and tokenized labels next to the raw ones.
+import os
+import pathlib
+import re
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from shdata import schema, text
+
+CHUNK_ROWS = 50000
+
+# Column types of the item data, as written by the shwscrp scraper, and of
+# the columns derived from it
+DTYPES = dict(schema.FIELDS, **schema.DERIVED)
+
+COLUMNS = schema.COLUMNS
+
+ARROW_TYPES = {'string': pa.string(), 'float': pa.float64(), 'int': pa.int64(),
+               'tokens': pa.list_(pa.string())}
+
+
+# Convert the columns of a raw chunk into their declared types
+def typed(chunk):
+    for col in chunk.columns:
+        kind = DTYPES.get(col, 'string')
+        if kind not in ('int', 'float'):
+            continue
+        values = pd.to_numeric(chunk[col], errors='coerce')
+        chunk[col] = values.astype('Int64') if kind == 'int' else values
+    return chunk
+
+
+# Page through an open DB-API cursor with fetchmany, one DataFrame per page
+def iter_cursor(cursor, columns=None, size=CHUNK_ROWS):
+    if columns is None:
+        # Hive returns names as table.column, keep the column part only
+        columns = [d[0].split('.')[-1] for d in cursor.description]
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        yield typed(pd.DataFrame.from_records(rows, columns=columns))
+
+
+# Run a query through pandas and yield the result in typed chunks
+def iter_query(query, conn, params=None, size=CHUNK_ROWS):
+    for chunk in pd.read_sql(query, conn, params=params, chunksize=size):
+        yield typed(chunk)
+
+
+def arrow_schema(columns):
+    return pa.schema([(c, ARROW_TYPES[DTYPES.get(c, 'string')])
+                      for c in columns])
+
+
+# File name part for a category, e.g. Men-s-Shoes for Men's Shoes
+def slug(name):
+    return re.sub(r'[^A-Za-z0-9]+', '-', name).strip('-')
+
+
+def snapshot_path(name, root):
+    return pathlib.Path(root) / (slug(name) + '.parquet')
+
+
+# Stream chunks into a Parquet file, one row group per chunk.
+# The file only replaces an existing snapshot once it is complete.
+def write_parquet(chunks, path):
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    writer = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            if writer is None:
+                schema = arrow_schema(chunk.columns)
+                writer = pq.ParquetWriter(str(tmp), schema)
+            writer.write_table(pa.Table.from_pandas(
+                chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+        if writer is None:
+            return 0
+        writer.close()
+        writer = None
+        os.replace(str(tmp), str(path))
+    finally:
+        if writer is not None:
+            writer.close()
+        if tmp.exists():
+            tmp.unlink()
+    return rows
+
+
+# Labels are cleaned here, once, so readers never process the raw text
+def write_snapshot(name, chunks, root):
+    return write_parquet(text.iter_clean(chunks), snapshot_path(name, root))
+
+
+# Read a snapshot back as a DataFrame, or None when it has not been written.
+# Only the requested columns are read from disk, and only the rows passing
+# filters, given as (column, op, value) tuples, e.g. ('PriceMin', '>=', 10).
+def read_snapshot(name, root, columns=None, filters=None):
+    path = snapshot_path(name, root)
+    if not path.exists():
+        return None
+    return pq.read_table(str(path), columns=columns, filters=filters or None).to_pandas()
+
+
+# Column names of a snapshot, or None when it has not been written
+def snapshot_columns(name, root):
+    path = snapshot_path(name, root)
+    if not path.exists():
+        return None
+    return pq.read_schema(str(path)).names
+
+
+# Columns to read from a file holding the stored columns for its cleaned
+# labels to stand in for Label: the given columns, or all but the dropped
+# ones, without the tokens
+def clean_columns(stored, drop=('URL',), columns=None):
+    if columns is None:
+        columns = [c for c in stored if c not in drop]
+    return [text.CLEAN if c == 'Label' else c for c in columns
+            if c in stored and c not in (text.CLEAN, text.TOKENS)]
+
+
+# Read a snapshot with its cleaned labels as the Label column, leaving out
+# the tokens and the dropped columns, or reading only the given columns.
+# None when there is no snapshot, or it was written before labels were
+# cleaned at ingest.
+def read_clean(name, root, drop=('URL',), columns=None, filters=None):
+    stored = snapshot_columns(name, root)
+    if stored is None or text.CLEAN not in stored:
+        return None
+    df = read_snapshot(name, root, columns=clean_columns(stored, drop, columns), filters=filters)
+    return df.rename(columns={text.CLEAN: 'Label'})
+
+
+# Concatenate chunks into one DataFrame, e.g. when no snapshot is kept
+def frame(chunks, columns=None):
+    chunks = list(chunks)
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,90 @@
+# Declared column types of the Shopee item data
+#
+# The fields match the ItemInfo CSV schema of the shwscrp scraper
+# (shwscrp/Program.fs), plus the Category column added when loading HBase.
+import sys
+
+import numpy as np
+import pandas as pd
+
+FIELDS = {
+    'Category': 'string',
+    'Label': 'string',
+    'Stars': 'float',
+    'Ratings': 'int',
+    'Sold': 'int',
+    'PriceMin': 'float',
+    'PriceMax': 'float',
+    'Stock': 'int',
+    'Seller': 'string',
+    'SellerRatings': 'int',
+    'Products': 'int',
+    'ResponseRate': 'float',
+    'ResponseTime': 'string',
+    'Joined': 'string',
+    'Followers': 'int',
+    'URL': 'string',
+}
+
+COLUMNS = [c for c in FIELDS if c != 'Category']
+
+# Product categories of the Shopee site, as scraped by shwscrp/get-data.cmd
+CATEGORIES = ["Automotive", "Baby & Toys", "Cameras & Drones", "Computer & Accessories", "Fashion Accessories",
+              "Games, Books & Hobbies", "Gaming & Consoles", "Groceries & Pets", "Health & Beauty",
+              "Home Appliances", "Home & Living", "Men's Bags & Wallets", "Men's Clothing", "Men's Shoes",
+              "Mobile & Gadgets", "Muslim Fashion", "Sports & Outdoor", "Tickets & Vouchers", "Travel & Luggage",
+              "Watches", "Women's Bags", "Women's Clothing", "Women's Shoes", "Others"]
+
+# Columns derived from the Label at ingest (shdata/text.py)
+DERIVED = {
+    'LabelClean': 'string',
+    'LabelTokens': 'tokens',
+}
+
+# Free text columns, only kept in memory when asked for
+TEXT = ['Label', 'URL', 'LabelClean', 'LabelTokens']
+
+# Low cardinality strings, stored once per distinct value
+CATEGORICAL = ['Category', 'Seller', 'ResponseTime', 'Joined']
+
+# Floats that only need a few significant digits (x.x stars, 0.xx rates)
+FLOAT32 = ['Stars', 'ResponseRate']
+
+
+# Convert a frame to the compact in-memory types, dropping the free text
+# columns unless they are listed in keep
+def apply_schema(df, keep=()):
+    df = df.drop([c for c in TEXT if c in df.columns and c not in keep], axis=1)
+    for col in df.columns:
+        kind = FIELDS.get(col)
+        if col in CATEGORICAL:
+            df[col] = df[col].astype('category')
+        elif kind == 'int':
+            values = pd.to_numeric(df[col], errors='coerce')
+            # Columns with missing values stay float64 to keep them exact
+            if values.notna().all():
+                values = pd.to_numeric(values.astype(np.int64), downcast='integer')
+            df[col] = values
+        elif kind == 'float':
+            values = pd.to_numeric(df[col], errors='coerce')
+            df[col] = values.astype(np.float32) if col in FLOAT32 else values
+    return df
+
+
+# Bytes used by each column before and after applying the schema
+def memory_report(before, after):
+    report = pd.DataFrame({'before': before.memory_usage(index=False, deep=True),
+                           'after': after.memory_usage(index=False, deep=True)})
+    report = report.reindex(before.columns).fillna(0).astype(np.int64)
+    report.loc['Total'] = report.sum()
+    report['saved %'] = (100 * (1 - report['after'] / report['before'])).round(1)
+    return report
+
+
+# Print the memory report for CSV or Parquet files:
+#   python -m shdata.schema dash-shope/data/Automotive.csv
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        raw = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+        print(path)
+        print(memory_report(raw, apply_schema(raw.copy())).to_string())
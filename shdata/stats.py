@@ -0,0 +1,212 @@
+# Mergeable descriptive statistics for the numeric item columns
+#
+# A Stats object keeps counts, sums of squares and cross products, minima,
+# maxima, null counts and a quantile sketch per column. Two of them can be
+# merged, so statistics are computed per chunk (in parallel if needed),
+# combined across categories and updated when new rows arrive, without
+# going back to the rows themselves.
+import math
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+class QuantileSketch:
+    # Log-bucketed sketch with a relative error of alpha on every quantile.
+    # Merging adds up the bucket counts, so the result does not depend on
+    # how the data was split into chunks.
+
+    def __init__(self, alpha=0.01):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.pos = {}
+        self.neg = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.zeros += int((values == 0).sum())
+        for store, part in ((self.pos, values[values > 0]),
+                            (self.neg, -values[values < 0])):
+            keys = np.ceil(np.log(part) / self.log_gamma).astype(np.int64)
+            keys, counts = np.unique(keys, return_counts=True)
+            for k, c in zip(keys.tolist(), counts.tolist()):
+                store[k] = store.get(k, 0) + c
+
+    def merge(self, other):
+        for store, part in ((self.pos, other.pos), (self.neg, other.neg)):
+            for k, c in part.items():
+                store[k] = store.get(k, 0) + c
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        if not self.count:
+            return np.nan
+        rank = q * (self.count - 1)
+        seen = 0
+        for k in sorted(self.neg, reverse=True):
+            seen += self.neg[k]
+            if seen > rank:
+                return -self.value(k)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.pos):
+            seen += self.pos[k]
+            if seen > rank:
+                return self.value(k)
+        return self.value(max(self.pos)) if self.pos else 0.0
+
+
+class Stats:
+    # Sums are kept relative to a per-column shift (the first chunk's means)
+    # so the cross products stay small and the variances accurate.
+
+    QUANTILES = [0.25, 0.5, 0.75]
+
+    def __init__(self, alpha=0.01):
+        self.alpha = alpha
+        self.columns = None
+        self.rows = 0
+        self.nulls = pd.Series(dtype=np.int64)
+
+    # Statistics of a whole frame, split into chunks computed in parallel
+    @classmethod
+    def compute(cls, df, chunk_rows=100000, workers=4):
+        chunks = [df.iloc[i:i + chunk_rows] for i in range(0, max(len(df), 1), chunk_rows)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(lambda c: cls().update(c), chunks))
+        total = parts[0]
+        for part in parts[1:]:
+            total.merge(part)
+        return total
+
+    # Add the rows of a frame
+    def update(self, df):
+        part = self._partial(df)
+        if self.columns is None:
+            self.__dict__.update(part.__dict__)
+        else:
+            self.merge(part)
+        return self
+
+    # Update from each chunk passing through, e.g. while writing a snapshot
+    def track(self, chunks):
+        for chunk in chunks:
+            self.update(chunk)
+            yield chunk
+
+    def _partial(self, df):
+        part = Stats(self.alpha)
+        part.columns = list(self.columns if self.columns is not None
+                            else df.select_dtypes('number').columns)
+        part.rows = len(df)
+        part.nulls = df.isnull().sum().astype(np.int64)
+
+        X = df.reindex(columns=part.columns).to_numpy(dtype=float)
+        M = ~np.isnan(X)
+        if self.columns is not None:
+            part.shift = self.shift
+        else:
+            with np.errstate(invalid='ignore'):
+                part.shift = np.nan_to_num(
+                    np.where(M, X, 0).sum(0) / np.maximum(M.sum(0), 1))
+        X0 = np.where(M, X - part.shift, 0)
+        Mf = M.astype(float)
+
+        # Entry [i, j] only covers the rows where both i and j are present
+        part.n = Mf.T @ Mf
+        part.sx = X0.T @ Mf
+        part.sxx = (X0 ** 2).T @ Mf
+        part.sxy = X0.T @ X0
+        part.min = np.where(M, X, np.inf).min(0) if len(X) else np.full(len(part.columns), np.inf)
+        part.max = np.where(M, X, -np.inf).max(0) if len(X) else np.full(len(part.columns), -np.inf)
+        part.sketches = []
+        for i in range(len(part.columns)):
+            sketch = QuantileSketch(self.alpha)
+            sketch.add(X[:, i])
+            part.sketches.append(sketch)
+        return part
+
+    # Combine another Stats over the same columns into this one
+    def merge(self, other):
+        if other.columns is None:
+            return self
+        if self.columns is None:
+            self.__dict__.update(pickle.loads(pickle.dumps(other.__dict__)))
+            return self
+        if other.columns != self.columns:
+            raise ValueError('Cannot merge statistics of different columns')
+
+        # Move the other sums onto this object's shift before adding them
+        d = other.shift - self.shift
+        n, sx = other.n, other.sx
+        self.sxy += (other.sxy + sx * d[None, :] + sx.T * d[:, None]
+                     + n * np.outer(d, d))
+        self.sxx += other.sxx + 2 * d[:, None] * sx + n * d[:, None] ** 2
+        self.sx += sx + n * d[:, None]
+        self.n += n
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        for mine, theirs in zip(self.sketches, other.sketches):
+            mine.merge(theirs)
+        self.rows += other.rows
+        self.nulls = self.nulls.add(other.nulls, fill_value=0).astype(np.int64)
+        return self
+
+    def count(self):
+        return pd.Series(np.diag(self.n), index=self.columns)
+
+    def mean(self):
+        n = np.diag(self.n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return pd.Series(np.diag(self.sx) / n + self.shift, index=self.columns)
+
+    def std(self):
+        n = np.diag(self.n)
+        sx = np.diag(self.sx)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = (np.diag(self.sxx) - sx ** 2 / n) / (n - 1)
+        return pd.Series(np.sqrt(np.maximum(var, 0)), index=self.columns)
+
+    # Same layout as DataFrame.describe(), with sketched quantiles
+    def describe(self):
+        rows = {'count': self.count(), 'mean': self.mean(), 'std': self.std(),
+                'min': pd.Series(self.min, index=self.columns)}
+        for q in self.QUANTILES:
+            # A sketched value is the middle of its bucket, which can lie
+            # outside the values seen
+            sketched = np.array([s.quantile(q) for s in self.sketches], dtype=float)
+            rows['{:g}%'.format(q * 100)] = pd.Series(
+                np.minimum(np.maximum(sketched, self.min), self.max), index=self.columns)
+        rows['max'] = pd.Series(self.max, index=self.columns)
+        return pd.DataFrame(rows).T.replace([np.inf, -np.inf], np.nan)
+
+    # Pairwise Pearson correlation, as DataFrame.corr() computes it
+    def corr(self):
+        n, sx, sxx = self.n, self.sx, self.sxx
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = n * self.sxy - sx * sx.T
+            var = n * sxx - sx ** 2
+            r = cov / np.sqrt(var * var.T)
+        return pd.DataFrame(np.clip(r, -1, 1), index=self.columns, columns=self.columns)
+
+    def save(self, path):
+        with open(str(path), 'wb') as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path):
+        with open(str(path), 'rb') as f:
+            return pickle.load(f)
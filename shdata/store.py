@@ -0,0 +1,281 @@
+# Append-only store of the scraped item data, partitioned by category and
+# scrape date
+#
+# Each CSV written by the shwscrp scraper (one per category, e.g.
+# Automotive.csv) is appended as a new Parquet part
+#
+#   <root>/category=<Category>/date=<YYYY-MM-DD>/part-<HHMMSS>-<checksum>.parquet
+#
+# holding typed columns and the cleaned labels, as the snapshots do, with
+# the statistics of its rows next to it. Parts are listed in
+# <root>/manifest.json with their row counts and checksums and are never
+# rewritten. A scrape covers a whole category, so the latest snapshot of a
+# category is its newest part, which readers see as soon as it is listed.
+#
+#   python -m shdata.store ingest shwscrp/*.csv
+#   python -m shdata.store watch shwscrp       # ingest CSVs as they are written
+#   python -m shdata.store list
+#   python -m shdata.store verify              # check the parts against their checksums
+import argparse
+import datetime
+import functools
+import hashlib
+import json
+import os
+import pathlib
+import re
+import time
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from shdata import ingest, schema, text
+from shdata.stats import Stats
+
+STORE_DIR = pathlib.Path(os.environ.get(
+    'SHDATA_STORE', str(pathlib.Path(__file__).resolve().parent.parent / 'store')))
+
+MANIFEST = 'manifest.json'
+
+# Seconds between scans of a watched directory, and that a CSV has to stay
+# unchanged before it is taken as completely written
+INTERVAL = 2.0
+SETTLE = 2.0
+
+
+# Category names compared without case, spaces or punctuation, so the file
+# names of get-data.cmd (Mens-Bags-Wallets.csv) match Men's Bags & Wallets
+def match_key(name):
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+
+CATEGORY_KEYS = {match_key(c): c for c in schema.CATEGORIES}
+
+
+# Category of a scraper CSV, from its file name
+def category_of(path):
+    stem = pathlib.Path(path).stem
+    return CATEGORY_KEYS.get(match_key(stem), stem)
+
+
+def checksum(path):
+    digest = hashlib.sha256()
+    with open(str(path), 'rb') as f:
+        for block in iter(lambda: f.read(1024 ** 2), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_manifest(root=STORE_DIR):
+    path = pathlib.Path(root) / MANIFEST
+    if not path.exists():
+        return {'parts': []}
+    return json.loads(path.read_text())
+
+
+# The manifest only replaces the previous one once completely written
+def write_manifest(manifest, root=STORE_DIR):
+    path = pathlib.Path(root) / MANIFEST
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(str(tmp), str(path))
+
+
+# Text columns are kept as written, e.g. sellers named with digits only
+TEXT_DTYPES = {c: str for c, kind in schema.FIELDS.items() if kind == 'string'}
+
+
+# Typed chunks of a scraper CSV, with the Category column of the HBase table
+def iter_csv(path, category, size=ingest.CHUNK_ROWS):
+    for chunk in pd.read_csv(str(path), dtype=TEXT_DTYPES, chunksize=size, skipinitialspace=True):
+        chunk.columns = [c.strip() for c in chunk.columns]
+        chunk.insert(0, 'Category', category)
+        yield ingest.typed(chunk)
+
+
+# Append a scraper CSV as a new part, returning its manifest entry, or None
+# when the same file was appended to the category before or holds no rows
+def append(path, root=STORE_DIR, category=None):
+    path = pathlib.Path(path)
+    root = pathlib.Path(root)
+    category = category or category_of(path)
+    manifest = read_manifest(root)
+    source = checksum(path)
+    if any(part['category'] == category and part['source_sha256'] == source
+           for part in manifest['parts']):
+        return None
+
+    scraped = datetime.datetime.fromtimestamp(path.stat().st_mtime, datetime.timezone.utc)
+    part = pathlib.Path('category=' + ingest.slug(category), 'date=' + scraped.strftime('%Y-%m-%d'),
+                        'part-{}-{}.parquet'.format(scraped.strftime('%H%M%S'), source[:12]))
+    summary = Stats()
+    rows = ingest.write_parquet(text.iter_clean(summary.track(iter_csv(path, category))), root / part)
+    if not rows:
+        return None
+    summary.save((root / part).with_suffix('.stats'))
+
+    entry = {'category': category,
+             'date': scraped.strftime('%Y-%m-%d'),
+             'scraped_at': scraped.isoformat(),
+             'ingested_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+             'path': part.as_posix(),
+             'rows': rows,
+             'bytes': (root / part).stat().st_size,
+             'sha256': checksum(root / part),
+             'source': path.name,
+             'source_sha256': source}
+    manifest['parts'].append(entry)
+    write_manifest(manifest, root)
+    return entry
+
+
+class Snapshot:
+    # The newest part of each category. Parts are only read when asked for,
+    # and only the requested columns and rows of them.
+
+    def __init__(self, root, parts):
+        self.root = pathlib.Path(root)
+        self.parts = parts
+
+    @property
+    def categories(self):
+        return sorted(self.parts)
+
+    def path(self, category):
+        return self.root / self.parts[category]['path']
+
+    # Rows of some categories (all by default) as stored, filters being
+    # (column, op, value) tuples as for ingest.read_snapshot. The parts hold
+    # their Category, so the partition directories are not read as columns.
+    def read(self, categories=None, columns=None, filters=None):
+        paths = [str(self.path(c)) for c in categories or self.categories]
+        dataset = pq.ParquetDataset(paths, filters=filters or None, partitioning=None)
+        return dataset.read(columns=columns).to_pandas()
+
+    # Rows of a category with its cleaned labels as the Label column, as
+    # ingest.read_clean reads a snapshot
+    def read_clean(self, category, columns=None, filters=None, drop=('URL',)):
+        stored = pq.read_schema(str(self.path(category))).names
+        df = self.read([category], ingest.clean_columns(stored, drop, columns), filters)
+        return df.rename(columns={text.CLEAN: 'Label'})
+
+    def stats(self, category):
+        return Stats.load(self.path(category).with_suffix('.stats'))
+
+
+# Changes whenever a part is appended, None before the first one
+def version(root=STORE_DIR):
+    try:
+        return (pathlib.Path(root) / MANIFEST).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+@functools.lru_cache(maxsize=4)
+def open_latest(root, version):
+    newest = {}
+    for part in read_manifest(root)['parts']:
+        current = newest.get(part['category'])
+        if current is None or (part['scraped_at'], part['ingested_at']) >= (
+                current['scraped_at'], current['ingested_at']):
+            newest[part['category']] = part
+    return Snapshot(root, newest)
+
+
+# The latest snapshot in the store, reopened once a part has been appended,
+# or None when nothing has been appended yet
+def latest(root=STORE_DIR):
+    current = version(root)
+    if current is None:
+        return None
+    return open_latest(str(root), current)
+
+
+# Append the CSVs written to a directory, each once it has stopped changing.
+# A CSV written again, e.g. by the next scrape, is appended again.
+def watch(directory, root=STORE_DIR, interval=INTERVAL, settle=SETTLE):
+    done = {}
+    changing = {}
+    while True:
+        for path in sorted(pathlib.Path(directory).glob('*.csv')):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            state = (stat.st_size, stat.st_mtime_ns)
+            if done.get(path) == state:
+                continue
+            if changing.get(path, (None,))[0] != state:
+                changing[path] = (state, time.monotonic())
+                continue
+            if time.monotonic() - changing[path][1] < settle:
+                continue
+            del changing[path]
+            done[path] = state
+            report(path, root)
+        time.sleep(interval)
+
+
+def report(path, root):
+    start = time.perf_counter()
+    try:
+        entry = append(path, root)
+    except Exception as e:
+        print('{:<32} failed: {}'.format(pathlib.Path(path).name, e), flush=True)
+        return
+    if entry is None:
+        print('{:<32} already stored'.format(pathlib.Path(path).name), flush=True)
+    else:
+        print('{:<32} {:>8} rows  {:6.1f}s  {}'.format(
+            entry['source'], entry['rows'], time.perf_counter() - start, entry['path']), flush=True)
+
+
+# Parts whose files are missing or differ from their checksums
+def verify(root=STORE_DIR):
+    bad = []
+    for part in read_manifest(root)['parts']:
+        path = pathlib.Path(root) / part['path']
+        if not path.exists() or checksum(path) != part['sha256']:
+            bad.append(part)
+    return bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Append scraper CSVs to the partitioned snapshot store.')
+    parser.add_argument('--store', default=str(STORE_DIR), help='store directory (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command')
+    ingest_cmd = commands.add_parser('ingest', help='append CSV files')
+    ingest_cmd.add_argument('files', nargs='+')
+    watch_cmd = commands.add_parser('watch', help='append the CSVs written to a directory as they appear')
+    watch_cmd.add_argument('directory')
+    watch_cmd.add_argument('--interval', type=float, default=INTERVAL, help='seconds between scans')
+    watch_cmd.add_argument('--settle', type=float, default=SETTLE,
+                           help='seconds a CSV has to stay unchanged before it is appended')
+    commands.add_parser('list', help='show the latest part of each category')
+    commands.add_parser('verify', help='check the parts against their checksums')
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        for path in args.files:
+            report(path, args.store)
+    elif args.command == 'watch':
+        print('Watching {} for CSV files'.format(args.directory))
+        watch(args.directory, args.store, args.interval, args.settle)
+    elif args.command == 'list':
+        snapshot = latest(args.store)
+        for cat in snapshot.categories if snapshot is not None else []:
+            part = snapshot.parts[cat]
+            print('{:<24} {:>8} rows  scraped {}  {}'.format(cat, part['rows'], part['scraped_at'], part['path']))
+    elif args.command == 'verify':
+        bad = verify(args.store)
+        for part in bad:
+            print('{} does not match its checksum'.format(part['path']))
+        print('{} parts checked, {} bad'.format(len(read_manifest(args.store)['parts']), len(bad)))
+        return 1 if bad else 0
+    else:
+        parser.print_help()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
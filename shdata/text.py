@@ -0,0 +1,202 @@
+# Unicode aware cleaning and tokenizing of item labels, run once at ingest
+#
+# Labels mix Malay, English, Chinese and emoji. The distinct labels of a
+# batch are joined into one text and handled as a single array of code
+# points: lookup tables give the NFKC form of each character and tell which
+# belong to the retained scripts, the rest become single spaces between
+# words. The tokens are the lower cased words of the cleaned labels, each
+# ideograph being a token of its own. Characters are classified once per process, as they
+# are first seen, so a batch costs a few NumPy passes over its text.
+import os
+import unicodedata
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Scripts kept in the cleaned labels, e.g. "Latin,Han" or "all". Digits are
+# always kept, and "Emoji" covers emoji and other pictographic symbols.
+SCRIPTS = os.environ.get('SHDATA_LABEL_SCRIPTS', 'all')
+
+# Columns written next to Label
+CLEAN = 'LabelClean'
+TOKENS = 'LabelTokens'
+
+# Scripts whose words are not separated by spaces
+IDEOGRAPHIC = {'Han', 'Hiragana', 'Katakana'}
+IDEOGRAPHS = r'([\p{Han}\p{Hiragana}\p{Katakana}])'
+
+# Scripts named differently from the first word of their character names
+ALIASES = {'Cjk': 'Han', 'Ideographic': 'Han', 'Combining': 'Inherited'}
+
+UNICODE = 0x110000
+SPACE = 32
+
+# Separates the labels of a batch in the joined text
+SEP = '\x00'
+
+
+# Script of a character: the first word of its Unicode name for letters and
+# marks, 'Common' for digits, 'Emoji' for symbols, None for separators
+def script(char):
+    category = unicodedata.category(char)
+    if category[0] == 'N' or char == '_':
+        return 'Common'
+    name = unicodedata.name(char, '')
+    if category == 'So' or name.startswith(('EMOJI', 'VARIATION SELECTOR')) or char == '\u200d':
+        return 'Emoji'
+    if category[0] in 'LM' and name:
+        word = name.split(' ', 1)[0].title()
+        return ALIASES.get(word, word)
+    return None
+
+
+def retained(scripts):
+    if isinstance(scripts, str):
+        scripts = [s.strip() for s in scripts.split(',') if s.strip()]
+    scripts = {s.title() for s in scripts}
+    return None if 'All' in scripts else scripts | {'Common', 'Inherited'}
+
+
+class Tables:
+    # Per code point lookup tables for one script selection, filled in as
+    # characters are first seen. clean gives the NFKC form of a character,
+    # e.g. full width letters as the plain ones, or a space for characters
+    # that are dropped. Characters whose form takes several code points
+    # (ligatures, circled numbers) are marked to have their labels
+    # normalized as a whole instead.
+
+    def __init__(self, scripts=SCRIPTS):
+        self.scripts = retained(scripts)
+        self.seen = np.zeros(UNICODE, dtype=bool)
+        self.expands = np.zeros(UNICODE, dtype=bool)
+        self.ideograph = np.zeros(UNICODE, dtype=bool)
+        self.clean = np.full(UNICODE, SPACE, dtype=np.uint32)
+        self.clean[0] = 0
+        self.add(range(1, 128))
+
+    def add(self, points):
+        for point in points:
+            form = unicodedata.normalize('NFKC', chr(point))
+            if len(form) != 1:
+                self.expands[point] = True
+                continue
+            if form != chr(point) and not self.seen[ord(form)]:
+                self.add([ord(form)])
+            kind = script(form)
+            if kind is None or (self.scripts is not None and kind not in self.scripts):
+                continue
+            self.clean[point] = ord(form)
+            self.ideograph[ord(form)] = kind in IDEOGRAPHIC
+        self.seen[list(points)] = True
+
+    # Classify the new characters of a batch, telling whether any of them
+    # needs the whole batch normalized
+    def update(self, points):
+        wide = points[points >= 128]
+        self.add(np.unique(wide[~self.seen[wide]]).tolist())
+        return self.expands[wide].any()
+
+
+tables = {}
+
+
+def tables_for(scripts):
+    key = scripts if isinstance(scripts, str) else ','.join(sorted(scripts))
+    if key not in tables:
+        tables[key] = Tables(scripts)
+    return tables[key]
+
+
+def code_points(text):
+    return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+
+
+def from_code_points(points):
+    return points.tobytes().decode('utf-32-le')
+
+
+# Labels with the characters of the other scripts dropped, leaving one space
+# between words. points are the labels joined by SEP.
+def clean_points(points, table):
+    points = table.clean[points]
+    # Dropped runs become spaces, kept as one when a kept character follows...
+    word = points != SPACE
+    out = points[word | np.r_[word[1:] & (points[1:] != 0), False]]
+    # ... and a kept character of the same label precedes them
+    first = np.r_[True, out[:-1] == 0][:len(out)]
+    return out[(out != SPACE) | ~first]
+
+
+# The labels of a batch as Arrow strings
+def clean_strings(points):
+    joined = pa.array([from_code_points(points)], type=pa.large_string())
+    return pc.split_pattern(joined, SEP).flatten().cast(pa.string())
+
+
+# Lower cased tokens of the cleaned labels, as one list of strings per label
+def token_lists(clean, points, table):
+    lower = pc.utf8_lower(clean)
+    ideographs = np.flatnonzero(table.ideograph[points])
+    if len(ideographs):
+        # Spaces around the ideographs of the labels having any, so each
+        # is a token of its own
+        rows = np.zeros(len(clean), dtype=bool)
+        rows[np.searchsorted(np.flatnonzero(points == 0), ideographs)] = True
+        spaced = pc.replace_substring_regex(lower.filter(rows), IDEOGRAPHS, r' \1 ')
+        lower = pc.replace_with_mask(lower, rows, pc.utf8_trim_whitespace(spaced))
+    tokens = pc.utf8_split_whitespace(lower)
+    # Splitting gives one empty token for an empty label
+    empty = pc.equal(pc.binary_length(clean), 0)
+    return pc.if_else(empty, pa.scalar([], type=tokens.type), tokens)
+
+
+# Token lists stay in Arrow memory where pandas supports it, which also
+# spares converting them back when the snapshot is written
+def series(array, index, arrow=False):
+    if arrow and hasattr(pd, 'ArrowDtype'):
+        return pd.Series(pd.arrays.ArrowExtensionArray(array), index=index)
+    values = array.to_pandas()
+    if index is not None:
+        values.index = index
+    return values
+
+
+# Cleaned labels and token lists, aligned with labels. Missing labels stay
+# missing in both.
+def clean_labels(labels, scripts=SCRIPTS):
+    index = getattr(labels, 'index', None)
+    encoded = pa.array(labels, type=pa.string(), from_pandas=True).dictionary_encode()
+    uniques = encoded.dictionary.to_pylist()
+    if not uniques:
+        return (pd.Series([None] * len(encoded), index=index, dtype=object),
+                pd.Series([None] * len(encoded), index=index, dtype=object))
+    text = SEP.join(uniques)
+    if text.count(SEP) != len(uniques) - 1:
+        text = SEP.join(u.replace(SEP, ' ') for u in uniques)
+    points = code_points(text)
+
+    table = tables_for(scripts)
+    if table.update(points):
+        points = code_points(unicodedata.normalize('NFKC', text))
+        table.update(points)
+    points = clean_points(points, table)
+    clean = clean_strings(points)
+    tokens = token_lists(clean, points, table)
+
+    # Missing labels have a null index, which takes a null
+    codes = encoded.indices
+    return series(clean.take(codes), index), series(tokens.take(codes), index, arrow=True)
+
+
+# Add the cleaned and tokenized label columns to a chunk that has a Label
+def add_columns(chunk, scripts=SCRIPTS):
+    if 'Label' in chunk.columns:
+        chunk[CLEAN], chunk[TOKENS] = clean_labels(chunk['Label'], scripts)
+    return chunk
+
+
+def iter_clean(chunks, scripts=SCRIPTS):
+    for chunk in chunks:
+        yield add_columns(chunk, scripts)
@@ -0,0 +1,168 @@
+# Timing of the hot paths of the web applications
+#
+# timed() measures a block or function and adds its latency to a per-stage
+# histogram. The histograms are served in the Prometheus text format, either
+# on a Flask route (the Dash apps) or on a small side server (Streamlit).
+#
+# Setting SHDATA_PROFILE_MS profiles every timed stage and dumps a cProfile
+# trace to SHDATA_PROFILE_DIR for calls slower than that many milliseconds.
+import contextlib
+import cProfile
+import functools
+import os
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float('inf')]
+
+PROFILE_MS = float(os.environ.get('SHDATA_PROFILE_MS', 0))
+PROFILE_DIR = os.environ.get('SHDATA_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'shdata-profiles'))
+
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += seconds
+        self.count += 1
+
+
+histograms = {}
+lock = threading.Lock()
+local = threading.local()
+
+
+def observe(stage, seconds):
+    with lock:
+        histograms.setdefault(stage, Histogram()).observe(seconds)
+
+
+class Timer:
+    # Times one run of a stage. Only the outermost timer of a thread profiles,
+    # as cProfile cannot run nested.
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.profile = None
+
+    def start(self):
+        depth = getattr(local, 'depth', 0)
+        local.depth = depth + 1
+        if PROFILE_MS and depth == 0:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self.began = time.perf_counter()
+        return self
+
+    def stop(self):
+        seconds = time.perf_counter() - self.began
+        local.depth -= 1
+        if self.profile is not None:
+            self.profile.disable()
+            if seconds * 1000 >= PROFILE_MS:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                name = '{}-{}.prof'.format(re.sub(r'[^A-Za-z0-9_.-]+', '_', self.stage),
+                                           time.strftime('%Y%m%d-%H%M%S'))
+                self.profile.dump_stats(os.path.join(PROFILE_DIR, name))
+        observe(self.stage, seconds)
+        return seconds
+
+
+# Time a block (with timed('stage'):) or every call of a function (@timed('stage'))
+class timed(contextlib.ContextDecorator):
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.timers = threading.local()
+
+    def __enter__(self):
+        stack = getattr(self.timers, 'stack', None)
+        if stack is None:
+            stack = self.timers.stack = []
+        stack.append(Timer(self.stage).start())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.timers.stack.pop().stop()
+        return False
+
+
+# All histograms in the Prometheus text exposition format
+def prometheus_text(name='shop_stage_seconds'):
+    lines = ['# HELP {} Latency of each application stage.'.format(name),
+             '# TYPE {} histogram'.format(name)]
+    with lock:
+        for stage, hist in sorted(histograms.items()):
+            label = stage.replace('\\', '\\\\').replace('"', '\\"')
+            total = 0
+            for bound, count in zip(BUCKETS, hist.counts):
+                total += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(name, label, le, total))
+            lines.append('{}_sum{{stage="{}"}} {}'.format(name, label, hist.sum))
+            lines.append('{}_count{{stage="{}"}} {}'.format(name, label, hist.count))
+    return '\n'.join(lines) + '\n'
+
+
+# Time every request of a Flask server and serve the histograms on /metrics.
+# Requests are labelled by their route, so /item/<id> is one stage, and Dash
+# callbacks by their output.
+def instrument(server):
+    import flask
+
+    @server.before_request
+    def start_timer():
+        rule = flask.request.url_rule
+        stage = 'http ' + (rule.rule if rule is not None else '<unmatched>')
+        if flask.request.path.endswith('_dash-update-component'):
+            body = flask.request.get_json(silent=True) or {}
+            stage = 'callback ' + str(body.get('output', ''))
+        flask.g.shdata_timer = Timer(stage).start()
+
+    @server.teardown_request
+    def stop_timer(exc):
+        timer = flask.g.pop('shdata_timer', None)
+        if timer is not None:
+            timer.stop()
+
+    @server.route('/metrics')
+    def metrics():
+        return flask.Response(prometheus_text(), mimetype='text/plain; version=0.0.4')
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+# Serve /metrics from a background thread, once per process. When the port
+# is taken, e.g. by a second instance of the app, the app runs without it.
+@functools.lru_cache(maxsize=None)
+def serve_metrics(port):
+    try:
+        server = ThreadingHTTPServer(('', port), MetricsHandler)
+    except OSError as e:
+        print('Metrics are not served on port {}: {}'.format(port, e), flush=True)
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,47 @@
+# Vectorized normalization of the seller time columns
+#
+# ResponseTime and Joined only hold a handful of distinct strings, so each
+# column is factorized once, the few distinct values are converted, and the
+# result is spread back over the rows with NumPy indexing.
+import numpy as np
+import pandas as pd
+
+# Hours in each ResponseTime unit
+RESPONSE_HOURS = {'minutes': 1 / 60, 'hours': 1, 'days': 24}
+
+# Months in each unit used by the Joined column, e.g. "21 months"
+JOINED_MONTHS = {'day': 1 / 30, 'days': 1 / 30,
+                 'week': 7 / 30, 'weeks': 7 / 30,
+                 'month': 1, 'months': 1,
+                 'year': 12, 'years': 12}
+
+
+# Look up a value per distinct entry of a column and broadcast it to the rows.
+# Entries that cannot be converted, and missing values, become NaN.
+def by_category(values, convert):
+    codes, uniques = pd.factorize(values)
+    table = np.append(np.asarray(convert(pd.Series(uniques, dtype=object)),
+                                 dtype=float), np.nan)
+    # Missing values have code -1, which picks the trailing NaN
+    return table[codes]
+
+
+def unit_factor(units, factors):
+    return units.str.strip().str.lower().map(factors)
+
+
+# Response rate scaled to hours, as transform_time did row by row
+def response_hours(rate, unit):
+    factor = by_category(unit, lambda u: unit_factor(u, RESPONSE_HOURS))
+    return pd.Series(np.asarray(rate, dtype=float) * factor,
+                     index=getattr(rate, 'index', None))
+
+
+# Time since the seller joined, in months
+def joined_months(joined):
+    def convert(values):
+        parts = values.str.extract(r'(\d+(?:\.\d+)?)\s*([A-Za-z]+)')
+        return pd.to_numeric(parts[0]) * unit_factor(parts[1], JOINED_MONTHS)
+
+    return pd.Series(by_category(joined, convert),
+                     index=getattr(joined, 'index', None))